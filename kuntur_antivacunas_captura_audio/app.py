@@ -1,14 +1,33 @@
 # app.py
 import os
-from flask import Flask
-from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+
 from dotenv import load_dotenv
-from routes.capture_routes import capture_bp
 
-# 1. Carga configuración de .env
+# 0. Carga configuración de .env (antes de leer el modo asíncrono)
 load_dotenv()
+
+# Modo asíncrono de Socket.IO: con eventlet/gevent hay que parchear la librería
+# estándar antes de importar nada más (miles de conexiones inactivas por proceso)
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')  # threading | eventlet | gevent
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, request
+from flask_cors import CORS
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from routes.capture_routes import capture_bp
+from services.capture_service import get_pipeline_stats
+from services.transcribe_service import get_http_stats, set_transcription_listener
+from services.ws_broadcaster import TranscriptionBroadcaster, site_room
+
+# 1. Configuración del servidor
 PORT = int(os.getenv('PORT', 5001))
+SOCKETIO_DEBUG = os.getenv('SOCKETIO_DEBUG', '0') == '1'
+WS_QUEUE_MAX = int(os.getenv('WS_QUEUE_MAX', '1000'))
 
 # 2. Inicializa Flask y CORS
 app = Flask(__name__)
@@ -16,12 +35,17 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 
 # 3. Inicializa SocketIO con configuración mejorada
 socketio = SocketIO(
-    app, 
+    app,
     cors_allowed_origins="*",
-    logger=True,  # Habilitar logs para debugging
-    engineio_logger=True,  # Logs más detallados
-    transport=['websocket', 'polling']  # Permitir ambos transportes
+    async_mode=ASYNC_MODE,
+    logger=SOCKETIO_DEBUG,  # Los logs por mensaje cuestan mucho con muchos clientes
+    engineio_logger=SOCKETIO_DEBUG,
+    transports=['websocket', 'polling'],  # Permitir ambos transportes
+    ping_interval=25,
+    ping_timeout=20
 )
+broadcaster = TranscriptionBroadcaster(socketio, maxsize=WS_QUEUE_MAX)
+connected_clients = 0
 
 # 4. Registra tus rutas REST de captura
 app.register_blueprint(capture_bp, url_prefix='/audio')
@@ -29,18 +53,39 @@ app.register_blueprint(capture_bp, url_prefix='/audio')
 # 5. Event handlers para WebSocket
 @socketio.on('connect')
 def handle_connect():
-    print(f'🔌 Cliente conectado via WebSocket desde {request.remote_addr if "request" in globals() else "unknown"}')
-    emit('connection_response', {'data': 'Conectado exitosamente'})
+    global connected_clients
+    connected_clients += 1
+    # El cliente puede indicar su local al conectar: io(url, { query: { site } })
+    site = request.args.get('site')
+    if site:
+        join_room(site_room(site))
+    emit('connection_response', {'data': 'Conectado exitosamente', 'site': site})
+
+@socketio.on('join')
+def handle_join(data):
+    """Suscribe al cliente a las transcripciones de un local ({'site': session_id})."""
+    site = (data or {}).get('site')
+    if site:
+        join_room(site_room(site))
+        emit('joined', {'site': site})
+
+@socketio.on('leave')
+def handle_leave(data):
+    site = (data or {}).get('site')
+    if site:
+        leave_room(site_room(site))
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('📤 Cliente desconectado')
+    global connected_clients
+    connected_clients -= 1
 
 # 6. Función para emitir transcripciones (será llamada desde otros módulos)
-def emit_transcription(text):
-    """Función para emitir transcripciones a todos los clientes conectados"""
-    print(f"📡 Emitiendo transcripción: {text}")
-    socketio.emit('new_transcription', {'text': text})
+def emit_transcription(text, site=None):
+    """Encola la transcripción para la sala del local; no bloquea al hilo que la llama"""
+    broadcaster.publish(text, site)
+
+set_transcription_listener(emit_transcription)
 
 # 7. Ruta de comprobación
 @app.route('/')
@@ -49,15 +94,26 @@ def index():
 
 @app.route('/health')
 def health():
-    return {'status': 'ok', 'port': PORT}
+    return {
+        'status': 'ok',
+        'port': PORT,
+        'pipeline': get_pipeline_stats(),
+        'transcribe_http': get_http_stats(),
+        'websocket': {
+            'async_mode': socketio.async_mode,
+            'clients': connected_clients,
+            **broadcaster.stats()
+        }
+    }
 
 # 8. Arranca con SocketIO
 if __name__ == '__main__':
-    print(f"🚀 Iniciando servidor en 0.0.0.0:{PORT}")
+    print(f"🚀 Iniciando servidor en 0.0.0.0:{PORT} (async_mode={socketio.async_mode})")
     socketio.run(
         app,
         host="0.0.0.0",  # Escuchar en todas las interfaces
         port=PORT,
-        debug=True,
-        allow_unsafe_werkzeug=True  # Para desarrollo
-    )
\ No newline at end of file
+        debug=SOCKETIO_DEBUG,
+        use_reloader=False,  # El reloader duplicaría las sesiones de captura
+        allow_unsafe_werkzeug=True  # Solo se usa en modo threading
+    )
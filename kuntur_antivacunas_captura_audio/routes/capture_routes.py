@@ -1,38 +1,50 @@
 from flask import Blueprint, jsonify, request
-from services.capture_service import start_capture_thread, stop_capture, store_local_info
+from services.capture_service import (
+    CaptureError, start_session, stop_session, list_sessions, make_session_id
+)
 
 capture_bp = Blueprint('capture', __name__)
 
 # Ruta para iniciar la captura de audio
 @capture_bp.route('/start-capture', methods=['POST'])
 def start_capture():
-    """Inicia la captura de audio"""
+    """Inicia (o reutiliza) la sesión de captura de un local"""
     try:
         # Recibir los parámetros enviados desde la solicitud POST
-        data = request.get_json()
-        
+        data = request.get_json(silent=True) or {}
+
         # Recibir la latitud, longitud, nombre_local e ip_camara
         latitud = data.get('latitud')
         longitud = data.get('longitud')
         nombre_local = data.get('nombre_local')
-        ip_camara = data.get('ip_camara')  # Este se puede almacenar pero no es necesario pasar a las funciones
+        ip_camara = data.get('ip_camara')
+        session_id = data.get('session_id')
+
+        # Cada local tiene su propia sesión; si no se indica, se deriva del nombre/cámara
+        session = start_session(session_id, latitud, longitud, nombre_local, ip_camara)
 
-        # Almacenar la información del local
-        store_local_info(latitud, longitud, nombre_local, ip_camara)
-        
-        # Llamar a la función que inicia la captura (la ip_camara se maneja globalmente)
-        start_capture_thread()
-        
-        return jsonify({"message": "Captura de audio iniciada."}), 200
+        return jsonify({"message": "Captura de audio iniciada.", "session_id": session.session_id}), 200
+    except CaptureError as e:
+        return jsonify({"message": str(e)}), e.status
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
 # Ruta para detener la captura de audio
 @capture_bp.route('/stop-capture', methods=['POST'])
 def stop_capture_route():
-    """Detiene la captura de audio"""
+    """Detiene la sesión de captura indicada"""
     try:
-        stop_capture()
-        return jsonify({"message": "Captura de audio detenida."}), 200
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id') or make_session_id(data.get('nombre_local'), data.get('ip_camara'))
+        stopped = stop_session(session_id)
+        return jsonify({"message": "Captura de audio detenida.", "session_id": stopped}), 200
+    except CaptureError as e:
+        return jsonify({"message": str(e)}), e.status
     except Exception as e:
-        return jsonify({"message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"message": str(e)}), 500
+
+# Ruta para listar las sesiones activas
+@capture_bp.route('/sessions', methods=['GET'])
+def sessions_route():
+    """Lista las sesiones de captura del proceso"""
+    return jsonify({"sessions": list_sessions()}), 200
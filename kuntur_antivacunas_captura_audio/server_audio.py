@@ -24,8 +24,8 @@ def capture_audio_fragment(ip_camara, duration=5):
             '-i', ip_camara,
             '-vn',  # Sin video
             '-acodec', 'pcm_s16le',  # Codec de audio
-            '-ar', '44100',  # Sample rate
-            '-ac', '2',  # Canales estéreo
+            '-ar', '16000',  # Sample rate nativo de Whisper
+            '-ac', '1',  # Mono
             '-t', str(duration),  # Duración en segundos
             '-y',  # Sobrescribir archivo si existe
             temp_path
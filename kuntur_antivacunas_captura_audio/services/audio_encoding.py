@@ -0,0 +1,44 @@
+# services/audio_encoding.py
+
+import subprocess
+from typing import Tuple
+
+from .audio_stream import pcm_to_wav
+
+# formato -> (extensión, mimetype, argumentos de códec para ffmpeg)
+FORMATS = {
+    'wav':  ('wav',  'audio/wav',  None),
+    'flac': ('flac', 'audio/flac', ['-c:a', 'flac', '-compression_level', '5', '-f', 'flac']),
+    'opus': ('ogg',  'audio/ogg',  ['-c:a', 'libopus', '-application', 'voip', '-f', 'ogg'])
+}
+
+
+def encode_fragment(pcm: bytes, sample_rate: int, channels: int, fmt: str = 'wav',
+                    ffmpeg_path: str = 'ffmpeg', opus_bitrate: str = '24k') -> Tuple[str, bytes, str]:
+    """
+    Codifica PCM s16le al formato de subida.
+    Devuelve (nombre_archivo, bytes, mimetype). Si FLAC/Opus fallan se envía WAV
+    para no perder el fragmento.
+    """
+    ext, mimetype, codec = FORMATS.get(fmt, FORMATS['wav'])
+    if codec is None:
+        return f"audio.{ext}", pcm_to_wav(pcm, sample_rate, channels), mimetype
+
+    cmd = [
+        ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+        *codec
+    ]
+    if fmt == 'opus':
+        cmd[-2:-2] = ['-b:a', opus_bitrate]
+    cmd.append('pipe:1')
+
+    try:
+        proc = subprocess.run(cmd, input=pcm, capture_output=True, timeout=10)
+        if proc.returncode == 0 and proc.stdout:
+            return f"audio.{ext}", proc.stdout, mimetype
+        print(f"⚠️ Error codificando a {fmt}: {proc.stderr.decode('utf-8', 'replace').strip()}")
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"⚠️ Error codificando a {fmt}: {e}")
+
+    return "audio.wav", pcm_to_wav(pcm, sample_rate, channels), 'audio/wav'
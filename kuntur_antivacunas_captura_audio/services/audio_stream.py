@@ -0,0 +1,273 @@
+# services/audio_stream.py
+
+import io
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from typing import Optional
+
+BYTES_PER_SAMPLE = 2  # pcm_s16le
+
+
+class PcmRingBuffer:
+    """
+    Buffer circular de tamaño fijo para PCM crudo.
+    Si el consumidor se atrasa, se descartan los bytes más antiguos
+    (siempre en múltiplos de `frame_size` para no desalinear muestras).
+    """
+
+    def __init__(self, capacity: int, frame_size: int):
+        capacity -= capacity % frame_size
+        self._buf = bytearray(capacity)
+        self._capacity = capacity
+        self._frame_size = frame_size
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped_bytes = 0
+
+    def __len__(self):
+        with self._cond:
+            return self._size
+
+    def write(self, data: bytes):
+        """Agrega bytes al final; descarta lo más antiguo si no hay espacio."""
+        if not data:
+            return
+        with self._cond:
+            if len(data) > self._capacity:
+                skip = len(data) - self._capacity
+                self.dropped_bytes += skip + self._size
+                data = data[skip:]
+                self._start = 0
+                self._size = 0
+
+            overflow = self._size + len(data) - self._capacity
+            if overflow > 0:
+                overflow += (-overflow) % self._frame_size
+                self._start = (self._start + overflow) % self._capacity
+                self._size -= overflow
+                self.dropped_bytes += overflow
+
+            end = (self._start + self._size) % self._capacity
+            first = min(len(data), self._capacity - end)
+            self._buf[end:end + first] = data[:first]
+            if first < len(data):
+                self._buf[:len(data) - first] = data[first:]
+            self._size += len(data)
+            self._cond.notify_all()
+
+    def read(self, n: int, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Bloquea hasta tener `n` bytes disponibles y los extrae.
+        Devuelve None si vence el timeout o el buffer se cierra.
+        """
+        n = min(n, self._capacity)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size >= n or self._closed, timeout):
+                return None
+            if self._size < n:
+                return None
+
+            first = min(n, self._capacity - self._start)
+            out = bytes(self._buf[self._start:self._start + first])
+            if first < n:
+                out += bytes(self._buf[:n - first])
+            self._start = (self._start + n) % self._capacity
+            self._size -= n
+            return out
+
+    def clear(self):
+        with self._cond:
+            self._start = 0
+            self._size = 0
+            self._closed = False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int) -> bytes:
+    """Envuelve PCM s16le en un contenedor WAV, todo en memoria."""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(BYTES_PER_SAMPLE)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return out.getvalue()
+
+
+class AudioStreamReader:
+    """
+    Mantiene un único proceso ffmpeg por micrófono que vuelca PCM por un pipe
+    al buffer circular. Los fragmentos se cortan del buffer sin huecos entre
+    ellos; si el stream se cae, se reconecta con backoff exponencial.
+    """
+
+    def __init__(self, url: str, sample_rate: int = 16000, channels: int = 1,
+                 ffmpeg_path: str = 'ffmpeg', buffer_sec: int = 30,
+                 backoff_min: float = 1.0, backoff_max: float = 30.0,
+                 stall_timeout: float = 10.0, chunk_size: int = 4096):
+        self.url = url
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.ffmpeg_path = ffmpeg_path
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stall_timeout = stall_timeout
+        self.chunk_size = chunk_size
+
+        self.frame_size = BYTES_PER_SAMPLE * channels
+        self.bytes_per_sec = sample_rate * self.frame_size
+        self.buffer = PcmRingBuffer(self.bytes_per_sec * buffer_sec, self.frame_size)
+
+        self.reconnects = 0
+        self._proc = None
+        self._last_data = 0.0
+        self._stop_event = threading.Event()
+        self._supervisor = None
+        self._stderr_tail = deque(maxlen=20)
+
+    # ------------------------------------------------------------------ ciclo de vida
+    def start(self) -> bool:
+        """Arranca el supervisor de ffmpeg. Devuelve False si ffmpeg no existe."""
+        if self._supervisor and self._supervisor.is_alive():
+            return True
+        if not shutil.which(self.ffmpeg_path):
+            print(f"❌ FFmpeg no encontrado en `{self.ffmpeg_path}`")
+            return False
+
+        self._stop_event.clear()
+        self.buffer.clear()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+        print(f"🎙️ Lector ffmpeg persistente iniciado para {self.url}")
+        return True
+
+    def stop(self):
+        """Detiene ffmpeg y libera a quien esté esperando un fragmento."""
+        self._stop_event.set()
+        self._kill()
+        self.buffer.close()
+        if self._supervisor and self._supervisor is not threading.current_thread():
+            self._supervisor.join(timeout=5)
+        print(f"🛑 Lector ffmpeg detenido para {self.url}")
+
+    @property
+    def running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def read_fragment(self, duration: float, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Extrae exactamente `duration` segundos de PCM del buffer."""
+        n = int(duration * self.sample_rate) * self.frame_size
+        if timeout is None:
+            timeout = duration + self.stall_timeout
+        return self.buffer.read(n, timeout=timeout)
+
+    # ------------------------------------------------------------------ internos
+    def _command(self):
+        return [
+            self.ffmpeg_path,
+            '-hide_banner',
+            '-loglevel', 'error',
+            '-nostdin',
+            '-i', self.url,
+            '-vn',
+            '-f', 's16le',
+            '-acodec', 'pcm_s16le',
+            '-ar', str(self.sample_rate),
+            '-ac', str(self.channels),
+            'pipe:1'
+        ]
+
+    def _kill(self):
+        proc = self._proc
+        if proc and proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def _supervise(self):
+        backoff = self.backoff_min
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            received = self._run_once()
+            if self._stop_event.is_set():
+                break
+
+            # Si el proceso llegó a entregar audio un buen rato, reiniciamos el backoff
+            if received and time.monotonic() - started > self.backoff_max:
+                backoff = self.backoff_min
+
+            self.reconnects += 1
+            tail = ' | '.join(self._stderr_tail) or 'sin detalle'
+            print(f"⚠️ Stream de audio caído ({tail}). Reintentando en {backoff:.0f}s…")
+            self._stderr_tail.clear()
+            if self._stop_event.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.backoff_max)
+
+    def _run_once(self) -> bool:
+        """Ejecuta un proceso ffmpeg hasta que termina; devuelve si recibió audio."""
+        try:
+            self._proc = subprocess.Popen(
+                self._command(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except OSError as e:
+            self._stderr_tail.append(str(e))
+            return False
+
+        proc = self._proc
+        self._last_data = time.monotonic()
+        received = {'bytes': 0}
+
+        reader = threading.Thread(target=self._pump, args=(proc, received), daemon=True)
+        stderr = threading.Thread(target=self._drain_stderr, args=(proc,), daemon=True)
+        reader.start()
+        stderr.start()
+
+        # Watchdog: si el micrófono se cuelga sin cerrar la conexión, matamos ffmpeg
+        while proc.poll() is None and not self._stop_event.is_set():
+            if time.monotonic() - self._last_data > self.stall_timeout:
+                self._stderr_tail.append(f"sin datos durante {self.stall_timeout:.0f}s")
+                self._kill()
+                break
+            self._stop_event.wait(1)
+
+        self._kill()
+        reader.join(timeout=5)
+        stderr.join(timeout=1)
+        return received['bytes'] > 0
+
+    def _pump(self, proc, received):
+        pending = b''
+        while True:
+            chunk = proc.stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            self._last_data = time.monotonic()
+            received['bytes'] += len(chunk)
+
+            # Solo escribimos tramas completas para no desalinear canales/muestras
+            data = pending + chunk
+            cut = len(data) - len(data) % self.frame_size
+            pending = data[cut:]
+            self.buffer.write(data[:cut])
+
+    def _drain_stderr(self, proc):
+        for line in iter(proc.stderr.readline, b''):
+            text = line.decode('utf-8', 'replace').strip()
+            if text:
+                self._stderr_tail.append(text)
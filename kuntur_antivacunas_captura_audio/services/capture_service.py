@@ -1,123 +1,313 @@
 # services/capture_service.py
 
 import os
-import time
-import subprocess
-import tempfile
+import re
 import threading
+import time
 from typing import Optional
 from dotenv import load_dotenv
-from .transcribe_service import send_to_transcribe
+from .audio_encoding import FORMATS, encode_fragment
+from .audio_stream import AudioStreamReader
+from .send_pipeline import AudioFragment, FragmentQueue, SenderPool
+from .spool import FragmentSpool
+from .transcribe_service import deliver_fragment
+from .vad import VoiceActivityGate
 
 # 1) Carga de configuración desde .env
 load_dotenv()
-IP_CAMARA     = os.getenv('MICROPHONE_URL')             # Ej: http://192.168.1.51:8080/audio.wav
+DEFAULT_MIC   = os.getenv('MICROPHONE_URL')             # Ej: http://192.168.1.51:8080/audio.wav
 FFMPEG_PATH   = os.getenv('FFMPEG_PATH', 'ffmpeg')       # Ruta o comando ffmpeg
 CAPTURE_SEC   = int(os.getenv('CAPTURE_DURATION', '5'))  # Segundos por fragmento
+SAMPLE_RATE   = int(os.getenv('CAPTURE_SAMPLE_RATE', '16000'))  # Whisper trabaja a 16 kHz mono
+CHANNELS      = int(os.getenv('CAPTURE_CHANNELS', '1'))
+UPLOAD_FORMAT = os.getenv('UPLOAD_FORMAT', 'wav')            # wav | flac | opus
+OPUS_BITRATE  = os.getenv('UPLOAD_OPUS_BITRATE', '24k')
+BUFFER_SEC    = int(os.getenv('AUDIO_BUFFER_SEC', '30'))     # Capacidad del buffer circular
+BACKOFF_MAX   = float(os.getenv('RECONNECT_BACKOFF_MAX', '30'))
+SEND_WORKERS  = int(os.getenv('SEND_WORKERS', '2'))          # Workers que envían a /transcribe
+SEND_QUEUE    = int(os.getenv('SEND_QUEUE_MAX', '10'))       # Fragmentos en espera antes de aplicar la política
+SEND_POLICY   = os.getenv('SEND_OVERFLOW_POLICY', 'merge')   # merge | drop_oldest | drop_newest
+MAX_MERGE_SEC = float(os.getenv('MAX_MERGE_SEC', '30'))      # Duración máxima de un fragmento fusionado
+MAX_SESSIONS  = int(os.getenv('MAX_CAPTURE_SESSIONS', '50')) # Sesiones simultáneas por proceso
+VAD_ENABLED   = os.getenv('VAD_ENABLED', '1') == '1'          # Descarta fragmentos en silencio antes de enviarlos
+VAD_THRESHOLD = float(os.getenv('VAD_THRESHOLD_DB', '-45'))   # Nivel mínimo (dBFS) de una trama con voz
+VAD_MARGIN    = float(os.getenv('VAD_MARGIN_DB', '10'))       # dB por encima del ruido de fondo
+VAD_MIN_RATIO = float(os.getenv('VAD_MIN_VOICED_RATIO', '0.05'))
+VAD_HANGOVER  = int(os.getenv('VAD_HANGOVER', '1'))           # Fragmentos que se envían tras la última voz
+VAD_PREROLL   = float(os.getenv('VAD_PREROLL_SEC', '1'))      # Cola del silencio que se antepone a la voz
+SPOOL_ENABLED = os.getenv('SPOOL_ENABLED', '1') == '1'        # Guarda en disco lo que no se pudo enviar
+SPOOL_DIR     = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_SEGMENT = int(os.getenv('SPOOL_SEGMENT_MB', '8')) * 1024 * 1024
+SPOOL_MAX     = int(os.getenv('SPOOL_MAX_MB', '512')) * 1024 * 1024
+SPOOL_MAX_AGE = float(os.getenv('SPOOL_MAX_AGE_HOURS', '168')) * 3600
 
-# 2) Variables globales de estado
-latitud        = None
-longitud       = None
-nombre_local   = None
-capture_active = False
-capture_thread = None
-
-def capture_audio_fragment(duration: int = CAPTURE_SEC) -> Optional[bytes]:
-    """Captura un fragmento de audio desde la IP_CAMARA durante `duration` segundos."""
-    if not IP_CAMARA:
-        print("❌ MICROPHONE_URL no configurada en .env")
-        return None
 
-    # Verificar ffmpeg
-    try:
-        subprocess.run([FFMPEG_PATH, '-version'], capture_output=True, check=True)
-    except subprocess.CalledProcessError:
-        print(f"❌ FFmpeg no encontrado en `{FFMPEG_PATH}`")
-        return None
+class CaptureError(Exception):
+    """Error de gestión de sesiones; `status` es el código HTTP sugerido."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
 
-    # Captura a fichero temporal
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tf:
-            temp_path = tf.name
-
-        cmd = [
-            FFMPEG_PATH,
-            '-i', IP_CAMARA,
-            '-vn',
-            '-acodec', 'pcm_s16le',
-            '-ar', '44100',
-            '-ac', '2',
-            '-t', str(duration),
-            '-y',
-            temp_path
-        ]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        if proc.returncode != 0:
-            print(f"❌ Error ffmpeg: {proc.stderr.strip()}")
-            return None
-
-        with open(temp_path, 'rb') as f:
-            data = f.read()
-        os.unlink(temp_path)
-        return data
-
-    except Exception as e:
-        print(f"❌ Excepción capturando audio: {e}")
+
+def normalize_mic_url(ip_camara: str) -> str:
+    """Si no viene con "/audio.wav", lo añadimos automáticamente."""
+    base = ip_camara.rstrip('/')
+    if base.endswith('/audio.wav'):
+        return base
+    if base.endswith('/video'):
+        base = base[:-len('/video')]
+    return f"{base}/audio.wav"
+
+
+def make_session_id(nombre_local=None, ip_camara=None) -> Optional[str]:
+    """Deriva un id estable para el local a partir de su nombre o su cámara."""
+    raw = nombre_local or ip_camara
+    if not raw:
         return None
+    slug = re.sub(r'[^a-z0-9]+', '-', str(raw).lower()).strip('-')
+    return slug or None
 
-def continuous_audio_capture():
-    """Bucle que, mientras capture_active sea True, graba y envía fragmentos."""
-    global capture_active
-    counter = 0
-    while capture_active:
-        counter += 1
-        print(f"📹 Capturando fragmento #{counter}...")
-        audio = capture_audio_fragment()
-        if audio:
-            print(f"✅ {len(audio)} bytes capturados. Enviando a transcribir…")
-            send_to_transcribe(audio)
-        else:
-            print("❌ No se obtuvo audio.")
-        print("-" * 30)
-        time.sleep(1)
-
-def start_capture_thread():
-    """Inicia el hilo de captura si no está ya activo."""
-    global capture_active, capture_thread
-    if capture_active:
-        print("⚠️ Captura ya activa.")
-        return
-    capture_active = True
-    capture_thread = threading.Thread(
-        target=continuous_audio_capture,
-        daemon=True
-    )
-    capture_thread.start()
-    print("🚀 Hilo de captura arrancado.")
-
-def stop_capture():
-    """Marca capture_active=False para que el hilo termine tras la próxima iteración."""
-    global capture_active
-    if not capture_active:
-        print("⚠️ Captura ya estaba detenida.")
+
+class CaptureSession:
+    """
+    Pipeline de captura de un local: lector ffmpeg persistente, hilo productor
+    y pool de envío propios. Cada sesión es independiente del resto.
+    """
+
+    def __init__(self, session_id, mic_url, latitud=None, longitud=None,
+                 nombre_local=None, ip_camara=None):
+        self.session_id = session_id
+        self.mic_url = mic_url
+        self.latitud = latitud
+        self.longitud = longitud
+        self.nombre_local = nombre_local
+        self.ip_camara = ip_camara
+        self.started_at = None
+        self.fragments = 0
+        self.active = False
+        self.reader = None
+        self.pool = None
+        self.gate = None
+        self._thread = None
+
+    def metadata(self) -> dict:
+        """Datos del local que viajan con cada fragmento a /transcribe."""
+        return {
+            'sitio': self.session_id,
+            'nombre_local': self.nombre_local,
+            'latitud': self.latitud,
+            'longitud': self.longitud,
+            'ip_camara': self.ip_camara
+        }
+
+    def start(self):
+        if UPLOAD_FORMAT not in FORMATS:
+            raise CaptureError(f"UPLOAD_FORMAT inválido: {UPLOAD_FORMAT} (usa {', '.join(FORMATS)})", status=500)
+        self.reader = AudioStreamReader(
+            self.mic_url,
+            sample_rate=SAMPLE_RATE,
+            channels=CHANNELS,
+            ffmpeg_path=FFMPEG_PATH,
+            buffer_sec=BUFFER_SEC,
+            backoff_max=BACKOFF_MAX
+        )
+        if not self.reader.start():
+            raise CaptureError(f"FFmpeg no encontrado en `{FFMPEG_PATH}`", status=500)
+
+        if VAD_ENABLED:
+            self.gate = VoiceActivityGate(
+                SAMPLE_RATE, CHANNELS,
+                threshold_db=VAD_THRESHOLD,
+                margin_db=VAD_MARGIN,
+                min_voiced_ratio=VAD_MIN_RATIO,
+                hangover=VAD_HANGOVER,
+                preroll_sec=VAD_PREROLL
+            )
+
+        queue = FragmentQueue(maxsize=SEND_QUEUE, policy=SEND_POLICY, max_merge_sec=MAX_MERGE_SEC)
+        self.pool = SenderPool(queue, self.send_fragment, workers=SEND_WORKERS,
+                               name=f"sender-{self.session_id}")
+        self.pool.start()
+
+        self.active = True
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._capture_loop,
+                                        name=f"capture-{self.session_id}", daemon=True)
+        self._thread.start()
+        print(f"🚀 Sesión {self.session_id} arrancada ({self.mic_url}).")
+
+    def stop(self):
+        """
+        Señala la parada y despierta al productor. El cierre (lector ffmpeg y
+        pool) lo hace solo el hilo de captura al salir; el pool termina de
+        enviar lo ya encolado.
+        """
+        if not self.active:
+            return
+        self.active = False
+        self.reader.buffer.close()
+        print(f"🛑 Señal de parada enviada a la sesión {self.session_id}.")
+
+    def send_fragment(self, fragment: AudioFragment) -> bool:
+        """Codifica el fragmento en UPLOAD_FORMAT y lo envía (se ejecuta en los workers)."""
+        filename, audio, mimetype = encode_fragment(
+            fragment.pcm, fragment.sample_rate, fragment.channels,
+            fmt=UPLOAD_FORMAT, ffmpeg_path=FFMPEG_PATH, opus_bitrate=OPUS_BITRATE
+        )
+        extra = f" ({fragment.merged} fusionados)" if fragment.merged > 1 else ""
+        print(f"📤 [{self.session_id}] Fragmento #{fragment.seq}{extra}: {len(audio)} bytes ({mimetype})")
+        metadata = self.metadata()
+        status = deliver_fragment(audio, metadata, filename=filename, mimetype=mimetype)
+        if status == 'unavailable' and spool:
+            # Servidor caído: el audio puede ser evidencia, se guarda para reenviarlo
+            metadata['capturado'] = fragment.captured_at
+            spool.append(audio, filename, mimetype, metadata)
+            print(f"💾 [{self.session_id}] Fragmento #{fragment.seq} guardado en el spool")
+        return status == 'ok'
+
+    def _capture_loop(self):
+        """
+        Productor: mientras la sesión esté activa, corta fragmentos y los encola.
+        El envío lo hacen los workers del SenderPool, así una transcripción lenta
+        no detiene la captura.
+        """
+        try:
+            while self.active:
+                pcm = self.reader.read_fragment(CAPTURE_SEC)
+                if not self.active:
+                    break
+                if pcm:
+                    self.fragments += 1
+                    if self.gate:
+                        pcm = self.gate.process(pcm)
+                        if pcm is None:
+                            continue  # silencio: no se envía
+                    self.pool.queue.put(AudioFragment(pcm, self.reader.sample_rate,
+                                                      self.reader.channels, seq=self.fragments))
+                else:
+                    print(f"❌ [{self.session_id}] No se obtuvo audio (esperando reconexión del stream).")
+        finally:
+            # Único dueño del cierre, tanto si se pidió la parada como si el bucle falló
+            self.active = False
+            self.reader.stop()
+            self.pool.stop()
+
+    def stats(self) -> dict:
+        stats = {
+            'session_id': self.session_id,
+            'nombre_local': self.nombre_local,
+            'mic_url': self.mic_url,
+            'active': self.active,
+            'started_at': self.started_at,
+            'fragments': self.fragments
+        }
+        if self.pool:
+            stats.update(self.pool.stats())
+        if self.gate:
+            stats.update(self.gate.stats())
+        if self.reader:
+            stats['reconnects'] = self.reader.reconnects
+            stats['buffer_dropped_bytes'] = self.reader.buffer.dropped_bytes
+        return stats
+
+
+# 2) Registro de sesiones activas, indexado por session_id
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# 3) Spool en disco compartido por todas las sesiones
+spool = None
+
+
+def _replay_record(record) -> str:
+    return deliver_fragment(record.payload, record.metadata,
+                            filename=record.filename, mimetype=record.mimetype)
+
+
+def _ensure_spool():
+    global spool
+    if not SPOOL_ENABLED or spool is not None:
         return
-    capture_active = False
-    print("🛑 Señal de parada enviada al hilo de captura.")
+    spool = FragmentSpool(SPOOL_DIR, segment_bytes=SPOOL_SEGMENT,
+                          max_bytes=SPOOL_MAX, max_age_sec=SPOOL_MAX_AGE)
+    spool.start_drainer(_replay_record)
 
-def store_local_info(lat, lon, local_name, ip_camara=None):
+
+def start_session(session_id=None, latitud=None, longitud=None,
+                  nombre_local=None, ip_camara=None) -> CaptureSession:
+    """Crea y arranca la sesión de captura de un local."""
+    session_id = session_id or make_session_id(nombre_local, ip_camara)
+    mic_source = ip_camara or DEFAULT_MIC
+    if not session_id or not mic_source:
+        raise CaptureError("Se requiere session_id, nombre_local o ip_camara (o MICROPHONE_URL en .env).")
+    mic_url = normalize_mic_url(mic_source)
+
+    with _sessions_lock:
+        current = _sessions.get(session_id)
+        if current and current.active:
+            if current.mic_url != mic_url:
+                raise CaptureError(
+                    f"La sesión {session_id} ya captura desde {current.mic_url}; deténla antes de cambiar de micrófono.",
+                    status=409
+                )
+            current.latitud, current.longitud = latitud, longitud
+            current.nombre_local = nombre_local or current.nombre_local
+            print(f"⚠️ Captura ya activa para {session_id}.")
+            return current
+
+        active = sum(1 for s in _sessions.values() if s.active)
+        if active >= MAX_SESSIONS:
+            raise CaptureError(f"Límite de {MAX_SESSIONS} sesiones de captura alcanzado.", status=503)
+
+        _ensure_spool()
+        session = CaptureSession(session_id, mic_url, latitud, longitud, nombre_local, ip_camara)
+        session.start()
+        _sessions[session_id] = session
+
+    print(f"📍 Local: {nombre_local} (Lat:{latitud}, Lon:{longitud}), Micrófono: {mic_url}")
+    return session
+
+
+def stop_session(session_id=None) -> str:
     """
-    Guarda la información del local (latitud, longitud, nombre)
-    y, opcionalmente, actualiza la URL de la cámara/audio.
+    Detiene una sesión. Sin session_id solo es válido si hay una única
+    sesión activa (compatibilidad con clientes de un solo local).
     """
-    global latitud, longitud, nombre_local, IP_CAMARA
-    latitud      = lat
-    longitud     = lon
-    nombre_local = local_name
+    with _sessions_lock:
+        if session_id is None:
+            active = [s for s in _sessions.values() if s.active]
+            if len(active) > 1:
+                raise CaptureError("Hay varias sesiones activas; indica session_id.")
+            if not active:
+                print("⚠️ Captura ya estaba detenida.")
+                return None
+            session = active[0]
+        else:
+            session = _sessions.get(session_id)
+            if session is None:
+                raise CaptureError(f"Sesión {session_id} no encontrada.", status=404)
+        del _sessions[session.session_id]
+
+    session.stop()
+    return session.session_id
+
 
-    if ip_camara:
-        # Si no viene con "/audio.wav", lo añadimos automáticamente
-        base = ip_camara.rstrip('/')
-        IP_CAMARA = base if base.endswith('/audio.wav') else f"{base}/audio.wav"
+def list_sessions() -> list:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    return [s.stats() for s in sessions]
 
-    print(f"📍 Local: {nombre_local} (Lat:{latitud}, Lon:{longitud}), Cámara: {IP_CAMARA}")
 
+def get_pipeline_stats() -> dict:
+    """Estado agregado de todas las sesiones, para /health."""
+    sessions = list_sessions()
+    totals = {}
+    for key in ('queue_depth', 'enqueued', 'dropped', 'merged', 'sent', 'failed',
+                'vad_sent', 'vad_skipped'):
+        totals[key] = sum(s.get(key, 0) for s in sessions)
+    totals['active_sessions'] = sum(1 for s in sessions if s['active'])
+    totals['sessions'] = {s['session_id']: s for s in sessions}
+    if spool:
+        totals['spool'] = spool.stats()
+    return totals
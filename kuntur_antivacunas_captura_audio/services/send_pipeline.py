@@ -0,0 +1,161 @@
+# services/send_pipeline.py
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from .audio_stream import BYTES_PER_SAMPLE
+
+POLICIES = ('drop_oldest', 'drop_newest', 'merge')
+
+
+class AudioFragment:
+    """Fragmento de PCM crudo listo para codificar y enviar."""
+
+    __slots__ = ('pcm', 'sample_rate', 'channels', 'seq', 'captured_at', 'merged')
+
+    def __init__(self, pcm: bytes, sample_rate: int, channels: int, seq: int = 0):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.seq = seq
+        self.captured_at = time.time()
+        self.merged = 1
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / (self.sample_rate * self.channels * BYTES_PER_SAMPLE)
+
+
+class FragmentQueue:
+    """
+    Cola acotada entre el hilo de captura (productor) y los workers de envío.
+    Cuando está llena aplica la política configurada:
+      - drop_oldest: descarta el fragmento más antiguo.
+      - drop_newest: descarta el fragmento recién capturado.
+      - merge:       une los dos fragmentos más antiguos (sin perder audio)
+                     mientras no superen `max_merge_sec`; si no, descarta el más antiguo.
+    """
+
+    def __init__(self, maxsize: int = 10, policy: str = 'merge', max_merge_sec: float = 30):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de desbordamiento inválida: {policy} (usa {', '.join(POLICIES)})")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.max_merge_sec = max_merge_sec
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.merged = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, fragment: AudioFragment):
+        """Encola sin bloquear nunca al productor."""
+        with self._cond:
+            self.enqueued += 1
+            if len(self._items) >= self.maxsize:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return
+                if not (self.policy == 'merge' and self._merge_oldest()):
+                    self._items.popleft()
+                    self.dropped += 1
+            self._items.append(fragment)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[AudioFragment]:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _merge_oldest(self) -> bool:
+        if len(self._items) < 2:
+            return False
+        first, second = self._items[0], self._items[1]
+        if first.duration + second.duration > self.max_merge_sec:
+            return False
+        first.pcm += second.pcm
+        first.merged += second.merged
+        del self._items[1]
+        self.merged += 1
+        return True
+
+
+class SenderPool:
+    """Pool de workers que vacían la FragmentQueue llamando a `send_fn`."""
+
+    def __init__(self, queue: FragmentQueue, send_fn: Callable[[AudioFragment], bool],
+                 workers: int = 2, name: str = 'sender'):
+        self.queue = queue
+        self.send_fn = send_fn
+        self.workers = max(1, workers)
+        self.name = name
+        self.sent = 0
+        self.failed = 0
+        self.busy = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5):
+        """Cierra la cola; los workers terminan de enviar lo pendiente y salen."""
+        self.queue.close()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def _work(self):
+        while True:
+            fragment = self.queue.get()
+            if fragment is None:
+                return
+            with self._lock:
+                self.busy += 1
+            try:
+                ok = self.send_fn(fragment)
+            except Exception as e:
+                print(f"❌ Error en worker de envío: {e}")
+                ok = False
+            with self._lock:
+                self.busy -= 1
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+
+    def stats(self) -> dict:
+        q = self.queue
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'queue_depth': len(q),
+            'queue_max': q.maxsize,
+            'queue_max_depth': q.max_depth,
+            'policy': q.policy,
+            'enqueued': q.enqueued,
+            'dropped': q.dropped,
+            'merged': q.merged,
+            'sent': self.sent,
+            'failed': self.failed
+        }
@@ -0,0 +1,269 @@
+# services/spool.py
+
+import json
+import os
+import struct
+import threading
+import time
+from typing import Callable, List, Optional
+
+HEADER = struct.Struct('<I')  # longitud del encabezado JSON de cada registro
+SEGMENT_EXT = '.seg'
+CURSOR_EXT = '.pos'
+
+
+class SpoolRecord:
+    """Fragmento guardado en disco junto con lo necesario para reenviarlo."""
+
+    __slots__ = ('payload', 'filename', 'mimetype', 'metadata', 'created')
+
+    def __init__(self, payload: bytes, filename: str, mimetype: str, metadata: dict, created: float):
+        self.payload = payload
+        self.filename = filename
+        self.mimetype = mimetype
+        self.metadata = metadata
+        self.created = created
+
+
+def _read_records(path: str) -> List[SpoolRecord]:
+    """Lee todos los registros completos de un segmento (ignora una cola truncada)."""
+    records = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        (header_len,) = HEADER.unpack_from(data, pos)
+        start = pos + HEADER.size
+        try:
+            header = json.loads(data[start:start + header_len])
+        except ValueError:
+            break
+        body = start + header_len
+        end = body + header['size']
+        if end > len(data):
+            break
+        records.append(SpoolRecord(data[body:end], header['filename'], header['mimetype'],
+                                   header.get('metadata') or {}, header['created']))
+        pos = end
+    return records
+
+
+class FragmentSpool:
+    """
+    Cola persistente, solo-append, para fragmentos que no se pudieron enviar.
+
+    Los registros se escriben en segmentos (`000000000001.seg`, ...) que rotan al
+    llegar a `segment_bytes`. Si el total supera `max_bytes`, o un segmento es más
+    antiguo que `max_age_sec`, se descartan los segmentos más viejos. Un hilo
+    drenador reenvía los registros en orden y guarda su posición en `<seg>.pos`
+    para no repetirlos tras un reinicio.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 8 * 1024 * 1024,
+                 max_bytes: int = 512 * 1024 * 1024, max_age_sec: float = 7 * 24 * 3600,
+                 retry_min: float = 2.0, retry_max: float = 60.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._drainer = None
+        self._segments = {}  # seq -> {'bytes': int, 'records': int, 'created': float}
+        self._cursors = {}   # seq -> registros ya enviados
+        self._active = None
+        self._active_file = None
+
+        self.appended = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.evicted_records = 0
+        self.evicted_segments = 0
+        self.last_error = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ------------------------------------------------------------------ disco
+    def _path(self, seq: int, ext: str = SEGMENT_EXT) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{ext}")
+
+    def _load(self):
+        """Reconstruye el índice a partir de los segmentos existentes."""
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(SEGMENT_EXT):
+                continue
+            seq = int(name[:-len(SEGMENT_EXT)])
+            path = self._path(seq)
+            records = len(_read_records(path))
+            self._segments[seq] = {
+                'bytes': os.path.getsize(path),
+                'records': records,
+                'created': os.path.getmtime(path)
+            }
+            try:
+                with open(self._path(seq, CURSOR_EXT)) as f:
+                    self._cursors[seq] = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                self._cursors[seq] = 0
+        if self._segments:
+            print(f"💾 Spool: {self.pending()} fragmentos pendientes en {self.directory}")
+
+    def _open_new_segment(self):
+        if self._active_file:
+            self._active_file.close()
+        seq = max(self._segments, default=0) + 1
+        self._active = seq
+        self._active_file = open(self._path(seq), 'ab')
+        self._segments[seq] = {'bytes': 0, 'records': 0, 'created': time.time()}
+        self._cursors[seq] = 0
+
+    def _seal_active(self):
+        if self._active_file:
+            self._active_file.close()
+        self._active_file = None
+        self._active = None
+
+    def _remove_segment(self, seq: int):
+        if seq == self._active:
+            self._seal_active()
+        self._segments.pop(seq, None)
+        self._cursors.pop(seq, None)
+        for ext in (SEGMENT_EXT, CURSOR_EXT):
+            try:
+                os.remove(self._path(seq, ext))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Aplica los límites de tamaño total y antigüedad (siempre sobre los más viejos)."""
+        now = time.time()
+        total = sum(s['bytes'] for s in self._segments.values())
+        for seq in sorted(self._segments):
+            seg = self._segments[seq]
+            too_big = total > self.max_bytes
+            too_old = now - seg['created'] > self.max_age_sec
+            if not (too_big or too_old):
+                break
+            lost = seg['records'] - self._cursors.get(seq, 0)
+            self.evicted_records += max(lost, 0)
+            self.evicted_segments += 1
+            total -= seg['bytes']
+            self._remove_segment(seq)
+            print(f"🗑️ Spool: segmento {seq} descartado ({'tamaño' if too_big else 'antigüedad'}, {lost} fragmentos)")
+
+    # ------------------------------------------------------------------ API
+    def append(self, payload: bytes, filename: str, mimetype: str, metadata: Optional[dict] = None):
+        """Guarda un fragmento al final del spool (fsync incluido)."""
+        header = json.dumps({
+            'size': len(payload),
+            'filename': filename,
+            'mimetype': mimetype,
+            'metadata': metadata or {},
+            'created': time.time()
+        }).encode('utf-8')
+        record = HEADER.pack(len(header)) + header + payload
+
+        with self._lock:
+            if self._active is None or self._segments[self._active]['bytes'] >= self.segment_bytes:
+                self._open_new_segment()
+            self._active_file.write(record)
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            seg = self._segments[self._active]
+            seg['bytes'] += len(record)
+            seg['records'] += 1
+            self.appended += 1
+            self._evict()
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        return sum(max(s['records'] - self._cursors.get(seq, 0), 0) for seq, s in self._segments.items())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': self.pending(),
+                'segments': len(self._segments),
+                'bytes': sum(s['bytes'] for s in self._segments.values()),
+                'appended': self.appended,
+                'replayed': self.replayed,
+                'rejected': self.rejected,
+                'evicted_records': self.evicted_records,
+                'evicted_segments': self.evicted_segments,
+                'last_error': self.last_error
+            }
+
+    # ------------------------------------------------------------------ drenado
+    def start_drainer(self, send_fn: Callable[[SpoolRecord], str]):
+        """
+        Arranca el hilo que reenvía los registros en orden. `send_fn` devuelve
+        'ok', 'rejected' (el servidor no lo acepta: se descarta) o 'unavailable'
+        (se reintenta más tarde con backoff).
+        """
+        if self._drainer and self._drainer.is_alive():
+            return
+        self._stop.clear()
+        self._drainer = threading.Thread(target=self._drain_loop, args=(send_fn,),
+                                         name='spool-drainer', daemon=True)
+        self._drainer.start()
+
+    def stop_drainer(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _drain_loop(self, send_fn):
+        backoff = self.retry_min
+        while not self._stop.is_set():
+            with self._lock:
+                seq = min(self._segments, default=None)
+                if seq is not None and seq == self._active:
+                    self._seal_active()  # lo nuevo irá a otro segmento
+            if seq is None:
+                self._wakeup.wait(30)
+                self._wakeup.clear()
+                continue
+
+            if self._drain_segment(seq, send_fn):
+                backoff = self.retry_min
+                continue
+
+            # El servidor sigue caído: esperar con backoff exponencial
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.retry_max)
+
+    def _drain_segment(self, seq: int, send_fn) -> bool:
+        """Reenvía un segmento sellado. Devuelve False si hay que esperar al servidor."""
+        try:
+            records = _read_records(self._path(seq))
+        except FileNotFoundError:
+            return True  # descartado por el desalojo mientras tanto
+
+        for index in range(self._cursors.get(seq, 0), len(records)):
+            if self._stop.is_set():
+                return False
+            status = send_fn(records[index])
+            if status == 'unavailable':
+                self.last_error = time.time()
+                return False
+
+            with self._lock:
+                if seq not in self._segments:
+                    return True
+                if status == 'ok':
+                    self.replayed += 1
+                else:
+                    self.rejected += 1
+                self._cursors[seq] = index + 1
+                with open(self._path(seq, CURSOR_EXT), 'w') as f:
+                    f.write(str(index + 1))
+
+        with self._lock:
+            self._remove_segment(seq)
+        if records:
+            print(f"✅ Spool: segmento {seq} reenviado ({len(records)} fragmentos)")
+        return True
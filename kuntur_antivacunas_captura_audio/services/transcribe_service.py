@@ -1,26 +1,149 @@
 # services/transcribe_service.py
 
-import io
+import random
+import threading
+import time
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import os
 
 # Cargar las variables de configuración desde el archivo .env
 load_dotenv()
-TRANSCRIBE_URL = os.getenv('TRANSCRIBE_URL')
+TRANSCRIBE_URL     = os.getenv('TRANSCRIBE_URL')
+HTTP_POOL_SIZE     = int(os.getenv('HTTP_POOL_SIZE', '20'))           # Conexiones keep-alive reutilizables
+HTTP_RETRIES       = int(os.getenv('TRANSCRIBE_RETRIES', '3'))        # Reintentos además del primer intento
+HTTP_BACKOFF       = float(os.getenv('TRANSCRIBE_BACKOFF', '0.5'))    # Base del backoff exponencial (s)
+HTTP_BACKOFF_MAX   = float(os.getenv('TRANSCRIBE_BACKOFF_MAX', '8'))
+CONNECT_TIMEOUT    = float(os.getenv('TRANSCRIBE_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT       = float(os.getenv('TRANSCRIBE_TIMEOUT', '30'))
+RETRY_STATUS       = {429, 503}   # El servidor rechazó el fragmento sin procesarlo: reenviarlo es seguro
 
-def send_to_transcribe(audio_data):
-    """Envía el fragmento de audio al endpoint de transcripción y emite la transcripción por WebSocket"""
+# Sesión compartida por todos los workers: pool de conexiones con keep-alive
+_http = requests.Session()
+_http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+_http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+
+
+class LatencyStats:
+    """Latencia de las peticiones a /transcribe (ventana de las últimas N)."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.last_ms = None
+
+    def record(self, ms: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            self.last_ms = ms
+            self._samples.append(ms)
+            if not ok:
+                self.errors += 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            stats = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'last_ms': round(self.last_ms, 1) if self.last_ms is not None else None
+            }
+        if samples:
+            stats['avg_ms'] = round(sum(samples) / len(samples), 1)
+            stats['p50_ms'] = round(samples[len(samples) // 2], 1)
+            stats['p95_ms'] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1)
+        return stats
+
+
+http_stats = LatencyStats()
+
+
+def _backoff_delay(attempt: int, retry_after=None) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After si el servidor lo envía."""
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * (2 ** attempt)))
+
+
+def _post_with_retries(files, data):
+    """
+    POST a /transcribe con reintentos acotados. Devuelve la respuesta o lanza la última excepción.
+    Solo se reintenta lo que el servidor seguro no procesó: errores de conexión
+    (incluido ConnectTimeout) y respuestas 429/503. Un ReadTimeout no se reintenta:
+    el servidor pudo haber transcrito el fragmento y repetirlo duplicaría la
+    transcripción, la alerta y la evidencia.
+    """
+    for attempt in range(HTTP_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            response = _http.post(TRANSCRIBE_URL, files=files, data=data,
+                                  timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except requests.exceptions.ReadTimeout:
+            http_stats.record((time.perf_counter() - start) * 1000, ok=False)
+            raise
+        except requests.exceptions.ConnectionError as e:
+            http_stats.record((time.perf_counter() - start) * 1000, ok=False)
+            if attempt == HTTP_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+            print(f"⚠️ Error de conexión ({type(e).__name__}); reintento {attempt + 1}/{HTTP_RETRIES} en {delay:.1f}s")
+        else:
+            ok = response.status_code == 200
+            http_stats.record((time.perf_counter() - start) * 1000, ok=ok)
+            if response.status_code not in RETRY_STATUS or attempt == HTTP_RETRIES:
+                return response
+            delay = _backoff_delay(attempt, response.headers.get('Retry-After'))
+            print(f"⚠️ Servidor respondió {response.status_code}; reintento {attempt + 1}/{HTTP_RETRIES} en {delay:.1f}s")
+
+        http_stats.retried()
+        time.sleep(delay)
+
+
+def get_http_stats() -> dict:
+    return http_stats.snapshot()
+
+
+_transcription_listener = None
+
+
+def set_transcription_listener(listener):
+    """Registra la función que recibe (texto, sitio) de cada transcripción."""
+    global _transcription_listener
+    _transcription_listener = listener
+
+
+def deliver_fragment(audio_data, metadata=None, filename="audio.wav", mimetype="audio/wav") -> str:
+    """
+    Envía el fragmento de audio al endpoint de transcripción y emite la transcripción por WebSocket.
+    `metadata` son los datos del local (sitio, nombre_local, latitud, ...) que viajan como campos del form.
+    Devuelve 'ok', 'rejected' (el servidor respondió con error, o no respondió a
+    tiempo y pudo haberlo procesado: reenviarlo no sirve o lo duplicaría)
+    o 'unavailable' (servidor caído o saturado: conviene guardarlo y reintentar).
+    """
     try:
-        # Preparar el archivo en memoria para el POST
+        # Los bytes se pasan tal cual para poder reenviarlos en cada reintento
         files = {
-            "audio": ("audio.wav", io.BytesIO(audio_data), "audio/wav")
+            "audio": (filename, audio_data, mimetype)
         }
 
         print(f"📤 Enviando {len(audio_data)} bytes a {TRANSCRIBE_URL}")
 
         # Llamada al endpoint de transcripción
-        response = requests.post(TRANSCRIBE_URL, files=files, timeout=30)
+        data = {k: v for k, v in (metadata or {}).items() if v is not None}
+        response = _post_with_retries(files, data)
 
         if response.status_code == 200:
             result = response.json()
@@ -28,23 +151,31 @@ def send_to_transcribe(audio_data):
 
             if transcribed_text:
                 print(f"🎤 Transcripción recibida: {transcribed_text}")
-                
-                # SOLUCIÓN: Importar la función emit_transcription en lugar de socketio
-                try:
-                    from app import emit_transcription
-                    emit_transcription(transcribed_text)
-                    print("✅ Transcripción emitida via WebSocket")
-                except ImportError as e:
-                    print(f"❌ Error importando emit_transcription: {e}")
-                except Exception as e:
-                    print(f"❌ Error emitiendo transcripción: {e}")
+
+                # El listener (app.emit_transcription) solo encola: nunca bloquea al worker
+                if _transcription_listener:
+                    try:
+                        _transcription_listener(transcribed_text, (metadata or {}).get('sitio'))
+                    except Exception as e:
+                        print(f"❌ Error emitiendo transcripción: {e}")
             else:
                 print("🔇 Audio sin contenido de voz")
+            return 'ok'
 
-        else:
-            print(f"❌ Error al transcribir: {response.status_code} - {response.text}")
+        print(f"❌ Error al transcribir: {response.status_code} - {response.text}")
+        return 'unavailable' if response.status_code in RETRY_STATUS else 'rejected'
 
+    except requests.exceptions.ReadTimeout:
+        print(f"⌛ /transcribe no respondió en {READ_TIMEOUT:.0f}s; no se reenvía (pudo haberse procesado)")
+        return 'rejected'
     except requests.exceptions.RequestException as e:
         print(f"❌ Error de conexión al transcribir: {e}")
+        return 'unavailable'
     except Exception as e:
-        print(f"❌ Error enviando audio: {e}")
\ No newline at end of file
+        print(f"❌ Error enviando audio: {e}")
+        return 'rejected'
+
+
+def send_to_transcribe(audio_data, metadata=None, filename="audio.wav", mimetype="audio/wav") -> bool:
+    """Como deliver_fragment, pero devuelve True si el servidor respondió correctamente."""
+    return deliver_fragment(audio_data, metadata, filename, mimetype) == 'ok'
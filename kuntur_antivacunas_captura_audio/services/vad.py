@@ -0,0 +1,112 @@
+# services/vad.py
+
+import math
+import sys
+from array import array
+from typing import Optional
+
+from .audio_stream import BYTES_PER_SAMPLE
+
+try:
+    import audioop  # Rápido (C), pero eliminado en Python 3.13
+except ImportError:
+    audioop = None
+
+FULL_SCALE = 32768.0
+
+
+def frame_rms(pcm: bytes) -> float:
+    """RMS de un bloque PCM s16le (todas las muestras, sin importar el canal)."""
+    if not pcm:
+        return 0.0
+    if audioop is not None:
+        return float(audioop.rms(pcm, BYTES_PER_SAMPLE))
+    samples = array('h')
+    samples.frombytes(pcm)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+def rms_to_dbfs(rms: float) -> float:
+    return 20 * math.log10(rms / FULL_SCALE) if rms > 0 else -120.0
+
+
+class VoiceActivityGate:
+    """
+    Compuerta de actividad de voz por energía, previa al envío a /transcribe.
+
+    El fragmento se divide en tramas de `frame_ms`; una trama cuenta como voz si
+    su nivel supera tanto `threshold_db` como el ruido de fondo estimado más
+    `margin_db`. Si la proporción de tramas con voz es menor que `min_voiced_ratio`
+    el fragmento se descarta, salvo durante `hangover` fragmentos tras una voz
+    (para no cortar el final de una frase). La cola de cada fragmento silencioso
+    (`preroll_sec`) se antepone al siguiente fragmento con voz para no perder
+    el inicio de las palabras.
+    """
+
+    def __init__(self, sample_rate: int, channels: int, threshold_db: float = -45.0,
+                 margin_db: float = 10.0, min_voiced_ratio: float = 0.05,
+                 hangover: int = 1, preroll_sec: float = 1.0, frame_ms: int = 30):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.min_voiced_ratio = min_voiced_ratio
+        self.hangover = hangover
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * channels * BYTES_PER_SAMPLE
+        self.preroll_bytes = int(sample_rate * preroll_sec) * channels * BYTES_PER_SAMPLE
+
+        self.noise_floor_db = None
+        self.last_ratio = 0.0
+        self.sent = 0
+        self.skipped = 0
+        self._hangover_left = 0
+        self._preroll = b''
+
+    def voiced_ratio(self, pcm: bytes) -> float:
+        """Proporción de tramas con voz; actualiza el ruido de fondo con las tramas tranquilas."""
+        levels = [
+            rms_to_dbfs(frame_rms(pcm[i:i + self.frame_bytes]))
+            for i in range(0, len(pcm) - self.frame_bytes + 1, self.frame_bytes)
+        ]
+        if not levels:
+            return 0.0
+
+        # El percentil 20 del fragmento aproxima el ruido de fondo; se suaviza entre fragmentos
+        quiet = sorted(levels)[len(levels) // 5]
+        if self.noise_floor_db is None:
+            self.noise_floor_db = quiet
+        else:
+            self.noise_floor_db = 0.9 * self.noise_floor_db + 0.1 * quiet
+
+        cut = max(self.threshold_db, self.noise_floor_db + self.margin_db)
+        return sum(1 for level in levels if level > cut) / len(levels)
+
+    def process(self, pcm: bytes) -> Optional[bytes]:
+        """Devuelve el PCM a enviar (con pre-roll si aplica) o None si es silencio."""
+        self.last_ratio = self.voiced_ratio(pcm)
+
+        if self.last_ratio >= self.min_voiced_ratio:
+            self._hangover_left = self.hangover
+            out = self._preroll + pcm
+            self._preroll = b''
+            self.sent += 1
+            return out
+
+        if self._hangover_left > 0:
+            self._hangover_left -= 1
+            self.sent += 1
+            return pcm
+
+        self._preroll = pcm[-self.preroll_bytes:] if self.preroll_bytes else b''
+        self.skipped += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            'vad_sent': self.sent,
+            'vad_skipped': self.skipped,
+            'vad_last_ratio': round(self.last_ratio, 3),
+            'vad_noise_floor_db': round(self.noise_floor_db, 1) if self.noise_floor_db is not None else None
+        }
@@ -0,0 +1,71 @@
+# services/ws_broadcaster.py
+
+import queue
+import threading
+
+
+def site_room(site) -> str:
+    """Nombre de la sala de Socket.IO de un local."""
+    return f"site:{site}"
+
+
+class TranscriptionBroadcaster:
+    """
+    Cola de salida no bloqueante entre los workers de captura y Socket.IO.
+    `publish` nunca espera: si la cola está llena se descarta lo más antiguo.
+    Una tarea en segundo plano (hilo, greenlet de eventlet/gevent según el
+    async_mode) la vacía y emite cada transcripción solo a la sala de su local.
+    """
+
+    def __init__(self, socketio, event: str = 'new_transcription', maxsize: int = 1000):
+        self.socketio = socketio
+        self.event = event
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._task = None
+        self.published = 0
+        self.emitted = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        with self._lock:
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def publish(self, text: str, site=None):
+        """Encola una transcripción para emitirla (llamado desde los hilos de captura)."""
+        self.start()
+        item = {'text': text, 'site': site}
+        with self._lock:
+            self.published += 1
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            room = site_room(item['site']) if item['site'] else None
+            try:
+                self.socketio.emit(self.event, item, to=room)
+                self.emitted += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Error emitiendo transcripción: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self._queue.qsize(),
+            'published': self.published,
+            'emitted': self.emitted,
+            'dropped': self.dropped,
+            'errors': self.errors
+        }
@@ -50,8 +50,9 @@ export function useTranscription({ latitud, longitud, nombre_local, ip_camara })
         const data = await response.json();
         console.log('✅ Captura iniciada exitosamente:', data);
         
-        // Iniciar conexión WebSocket solo después de iniciar la captura
-        initWebSocket();
+        // Iniciar conexión WebSocket solo después de iniciar la captura,
+        // suscrita a la sala de este local
+        initWebSocket(data.session_id);
         
       } catch (error) {
         console.error('❌ Error iniciando captura:', error);
@@ -60,7 +61,7 @@ export function useTranscription({ latitud, longitud, nombre_local, ip_camara })
     };
 
     // 2) Función para inicializar WebSocket
-    const initWebSocket = () => {
+    const initWebSocket = (sessionId) => {
       console.log('🔌 Iniciando conexión WebSocket...');
       console.log('🎯 WebSocket URL:', API_BASE_URL);
       setConnectionStatus('connecting');
@@ -83,6 +84,8 @@ export function useTranscription({ latitud, longitud, nombre_local, ip_camara })
         reconnectionAttempts: 5,
         reconnectionDelay: 1000,
         reconnectionDelayMax: 5000,
+        // Solo recibimos las transcripciones de nuestro local
+        query: sessionId ? { site: sessionId } : undefined,
         // Configuración específica para React Native
         jsonp: false,
         forceBase64: false
@@ -173,7 +176,9 @@ export function useTranscription({ latitud, longitud, nombre_local, ip_camara })
       
       // Detener captura
       fetch(`${API_BASE_URL}/audio/stop-capture`, { 
-        method: 'POST' 
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nombre_local, ip_camara })
       })
       .then(() => console.log('🛑 Captura detenida'))
       .catch(error => console.warn('⚠️ Error deteniendo captura:', error));
@@ -1,13 +1,20 @@
+# Con SERVER_ASYNC_MODE=gevent el monkey patching va antes de cualquier otro import
+from services.async_mode import parchear, MODO
+parchear()
+
 import os
 from dotenv import load_dotenv
 from flask import Flask
-from faster_whisper import WhisperModel
 
 from routes.auth_routes import auth_bp
 from routes.transcribe_routes import transcribe_bp
 from routes.stream_routes import stream_bp
 from routes.alerta_routes import alerta_bp
-from services.global_state import event_queue, eventos_detectados
+from routes.streaming_routes import streaming_bp
+from routes.estado_routes import estado_bp
+from services.whisper_registry import precargar_modelos
+from services.event_store import asegurar_indices
+from services.camera_monitor import monitor_camaras
 
 # Cargar variables de entorno
 load_dotenv()
@@ -16,14 +23,18 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "mi_clave_secreta")
 
-# Cargar modelo Whisper una vez al inicio
-whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
+# Cargar y calentar los modelos Whisper una sola vez (compartidos por todos los blueprints)
+precargar_modelos()
+asegurar_indices()
+monitor_camaras.iniciar()
 
 # Registrar Blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(transcribe_bp)
 app.register_blueprint(stream_bp)
 app.register_blueprint(alerta_bp)
+app.register_blueprint(streaming_bp)
+app.register_blueprint(estado_bp)
 
 # Filtro personalizado para escapar texto en JS
 @app.template_filter('escapejs')
@@ -33,4 +44,10 @@ def escapejs_filter(value):
 
 # Ejecutar app
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    if MODO == "gevent":
+        # Servidor asíncrono: cientos de paneles SSE sin un hilo del sistema por conexión
+        from gevent.pywsgi import WSGIServer
+        print("🚀 Servidor gevent en 0.0.0.0:5000")
+        WSGIServer(("0.0.0.0", 5000), app).serve_forever()
+    else:
+        app.run(debug=True, host="0.0.0.0", port=5000)
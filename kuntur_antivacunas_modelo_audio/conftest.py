@@ -0,0 +1 @@
+# Raíz de pytest: deja importables `services` y `routes` desde tests/
@@ -5,9 +5,11 @@ from datetime import datetime
 from flask import Blueprint, request
 from bson import ObjectId
 from services.gemini_analyzer import procesar_evento_con_ia
-from services.video_uploader import grabar_y_subir_video
+from services.video_uploader import programar_evidencia, registrar_evidencia
 from services.db import coleccion_alertas
-from services.global_state import event_queue, eventos_detectados
+from services.event_store import eventos_detectados
+from services.event_hub import hub
+from services.context_window import clave_sitio
 from services.notificador_upc import notificar_a_upc
 
 alerta_bp = Blueprint("alerta", __name__)
@@ -24,6 +26,7 @@ def alerta_manual():
         "texto": texto_simulado,
         "hora": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "manual": True,
+        "sitio": data.get("sitio"),
         "nombre_local": data.get("nombre_local"),
         "ubicacion": data.get("ubicacion"),
         "ip_camara": data.get("ip_camara"),
@@ -37,22 +40,18 @@ def alerta_manual():
         print(f"❌ Error IA manual: {e}")
         evento_enriquecido = evento
         evento_enriquecido["analisis_ia"] = "No disponible"
+        evento_enriquecido["nivel_riesgo"] = "MEDIO"
 
-    try:
-        link_video = grabar_y_subir_video(
-            evento["ip_camara"],
-            bucket_name="kuntur-extorsiones",
-            key_id=os.getenv("B2_KEY_ID"),
-            app_key=os.getenv("B2_APP_KEY")
-        )
-        evento_enriquecido["link_evidencia"] = link_video
-    except Exception as e:
-        print(f"⚠️ Error subiendo video: {e}")
-        evento_enriquecido["link_evidencia"] = "No disponible"
+    evidencia = programar_evidencia(
+        evento_enriquecido,
+        bucket_name="kuntur-extorsiones",
+        key_id=os.getenv("B2_KEY_ID"),
+        app_key=os.getenv("B2_APP_KEY")
+    )
 
-    eventos_detectados.append(evento_enriquecido)
+    eventos_detectados.agregar(evento_enriquecido)
 
-    event_queue.put({
+    hub.publicar({
         "mensaje": "🚨 Alerta manual activada",
         "evento_id": evento_id,
         "texto": evento_enriquecido["texto"],
@@ -64,17 +63,12 @@ def alerta_manual():
         "ubicacion": evento_enriquecido.get("ubicacion"),
         "latitud": evento_enriquecido.get("latitud"),
         "longitud": evento_enriquecido.get("longitud")
-    })
-
-    riesgo = "MEDIO"
-    for nivel in ["CRÍTICO", "ALTO", "MEDIO", "BAJO"]:
-        if nivel.lower() in evento_enriquecido["analisis_ia"].lower():
-            riesgo = nivel
-            break
+    }, sitio=clave_sitio(evento_enriquecido))
 
     # Tolerante con usuario_id: puede no venir
     usuario_id = data.get("usuario_id")
     mongo_doc = {
+        "evento_id": evento_id,
         "nombre_local": evento_enriquecido.get("nombre_local"),
         "ubicacion": evento_enriquecido.get("ubicacion"),
         "ip_camara": evento_enriquecido.get("ip_camara"),
@@ -82,9 +76,10 @@ def alerta_manual():
         "longitud": evento_enriquecido.get("longitud"),
         "texto_detectado": evento_enriquecido["texto"],
         "descripcion_alerta": evento_enriquecido["analisis_ia"],
-        "nivel_riesgo": riesgo,
+        "nivel_riesgo": evento_enriquecido["nivel_riesgo"],
         "fecha": datetime.now(),
-        "link_evidencia": evento_enriquecido.get("link_evidencia", "No disponible")
+        "link_evidencia": evento_enriquecido.get("link_evidencia", "No disponible"),
+        "estado_evidencia": evento_enriquecido.get("estado_evidencia")
     }
     if usuario_id:
         try:
@@ -93,6 +88,7 @@ def alerta_manual():
             mongo_doc["id_usuario"] = usuario_id  # por si no es un ObjectId válido
 
     coleccion_alertas.insert_one(mongo_doc)
+    registrar_evidencia(evento_id, evidencia)
 
     notificar_a_upc(
         descripcion=evento_enriquecido["analisis_ia"],
@@ -0,0 +1,50 @@
+# routes/estado_routes.py
+from flask import Blueprint, jsonify, request
+from services.inference_scheduler import planificador
+from services.whisper_registry import estado_modelos
+from services.job_queue import cola_trabajos
+from services.threat_prefilter import prefiltro
+from services.llm_cache import estado_caches
+from services.gemini_provider import pool
+from services.context_window import ventanas
+from services.video_buffer import grabadores
+from services.evidence_storage import subidor
+from services.event_hub import hub
+from services.event_store import eventos_detectados
+from services.camera_monitor import monitor_camaras
+
+estado_bp = Blueprint("estado", __name__)
+
+
+@estado_bp.route("/estado")
+def estado():
+    """Métricas internas del servidor (modelos, inferencia, cola de trabajos, prefiltro, caché, Gemini, ventanas, video, SSE, eventos, cámaras)."""
+    return jsonify({
+        "whisper": estado_modelos(),
+        "inferencia": planificador.estado(),
+        "trabajos": cola_trabajos.resumen(),
+        "prefiltro": prefiltro.estado(),
+        "cache_llm": estado_caches(),
+        "gemini": pool.estado(),
+        "ventanas": ventanas.estado(),
+        "camaras": grabadores.estado(),
+        "subidas": subidor.estado(),
+        "sse": hub.estado(),
+        "eventos": eventos_detectados.estado(),
+        "monitor_camaras": monitor_camaras.estado()
+    })
+
+
+@estado_bp.route("/estado/jobs")
+def listar_jobs():
+    """Últimos trabajos en segundo plano, del más reciente al más antiguo."""
+    limite = request.args.get("limite", 50, type=int)
+    return jsonify(cola_trabajos.listar(limite))
+
+
+@estado_bp.route("/estado/jobs/<job_id>")
+def estado_job(job_id):
+    trabajo = cola_trabajos.estado(job_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(trabajo)
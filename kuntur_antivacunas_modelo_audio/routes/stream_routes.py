@@ -1,10 +1,10 @@
 # routes/stream_routes.py
 
-import json
-import cv2
-import queue
-from flask import Blueprint, Response, render_template, session
-from services.global_state import event_queue, eventos_detectados
+from flask import Blueprint, Response, render_template, request, session
+from services.event_store import eventos_detectados
+from services.event_hub import hub, formato_sse
+from services.video_buffer import generar_mjpeg
+from services.camera_monitor import monitor_camaras
 
 
 stream_bp = Blueprint("stream", __name__)
@@ -12,19 +12,37 @@ stream_bp = Blueprint("stream", __name__)
 
 @stream_bp.route("/stream")
 def stream():
+    """
+    SSE con todos los eventos (o solo los de `?sitio=<sitio de captura_audio, cámara o nombre_local>`).
+    Al reconectar, el navegador envía Last-Event-ID y se reenvía lo perdido.
+    """
+    sitio = request.args.get("sitio")
+    ultimo_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+
     def event_stream():
-        while True:
-            try:
-                data = event_queue.get(timeout=30)
-                yield f"data: {json.dumps(data)}\n\n"
-            except queue.Empty:
-                yield "data: \n\n"
-    return Response(event_stream(), content_type="text/event-stream")
+        suscripcion = hub.suscribir(sitio, ultimo_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                eventos = suscripcion.esperar(timeout=15)
+                if not eventos:
+                    yield ": ping\n\n"  # Comentario SSE: mantiene viva la conexión sin disparar onmessage
+                for evento in eventos:
+                    yield formato_sse(evento)
+        finally:
+            hub.cancelar(suscripcion)
+
+    return Response(
+        event_stream(),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @stream_bp.route("/alerta/<evento_id>")
 def ver_alerta(evento_id):
-    evento = next((e for e in eventos_detectados if e["id"] == evento_id), None)
+    evento = eventos_detectados.obtener(evento_id)
     if not evento:
         return "Evento no encontrado", 404
 
@@ -45,7 +63,7 @@ def video_feed():
         return "No autorizado", 403
 
     return Response(
-        generar_frames(session["ip_camara"]),
+        generar_mjpeg(session["ip_camara"]),
         mimetype="multipart/x-mixed-replace; boundary=frame"
     )
 
@@ -55,23 +73,7 @@ def estado_camara():
     ip = session.get("ip_camara")
     if not ip:
         return {"estado": "no disponible"}
-    try:
-        cap = cv2.VideoCapture(ip)
-        success, _ = cap.read()
-        cap.release()
-        return {"estado": "activa" if success else "inactiva"}
-    except:
-        return {"estado": "inactiva"}
-
-
-# Utilidad local
-def generar_frames(ip_camara):
-    cap = cv2.VideoCapture(ip_camara)
-    while True:
-        success, frame = cap.read()
-        if not success:
-            break
-        ret, buffer = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    # Estado en caché del monitor de cámaras: el request no abre la cámara
+    return monitor_camaras.estado_camara(ip)
+
 
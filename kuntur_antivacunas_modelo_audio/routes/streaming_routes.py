@@ -0,0 +1,108 @@
+# routes/streaming_routes.py
+import os
+import json
+import time
+from flask import Blueprint, session
+from flask_sock import Sock, ConnectionClosed
+from services.streaming_transcriber import TranscriptorStreaming
+from services.procesador_transcripcion import procesar_transcripcion
+from services.whisper_registry import obtener_modelo, MODELO_STREAMING
+from services.async_mode import en_hilo_nativo
+
+streaming_bp = Blueprint("streaming", __name__)
+sock = Sock()
+
+PASO_SEG = float(os.getenv("STREAM_STEP_SEC", "1.0"))          # Cada cuánto audio nuevo se decodifica
+VENTANA_SEG = float(os.getenv("STREAM_WINDOW_SEC", "15"))      # Ventana máxima sin confirmar
+FLUSH_SEG = float(os.getenv("STREAM_FLUSH_SEC", "5"))          # Texto final acumulado antes de evaluar amenaza
+CAMPOS_LOCAL = ("sitio", "nombre_local", "ubicacion", "ip_camara", "latitud", "longitud")
+
+
+def _leer_json(mensaje):
+    """Objeto JSON de un mensaje de texto; None si no es un objeto JSON válido."""
+    try:
+        datos = json.loads(mensaje or "{}")
+    except (TypeError, ValueError):
+        return None
+    return datos if isinstance(datos, dict) else None
+
+
+def _enviar_error(ws, mensaje):
+    ws.send(json.dumps({"type": "error", "message": mensaje}))
+
+
+@sock.route("/transcribe/stream", bp=streaming_bp)
+def transcribe_stream(ws):
+    """
+    Transcripción en vivo por WebSocket.
+
+    1. El cliente envía un JSON inicial con los datos del local
+       ({"nombre_local": ..., "ip_camara": ..., "sample_rate": 16000}).
+    2. Luego envía PCM s16le mono a 16 kHz en mensajes binarios.
+    3. El servidor responde {"type": "partial"|"final", "text": ...}.
+    4. {"event": "end"} cierra el stream y confirma lo pendiente.
+    """
+    mensaje = ws.receive()
+    inicio = _leer_json(mensaje) if not isinstance(mensaje, bytes) else None
+    if inicio is None:
+        _enviar_error(ws, "El primer mensaje debe ser un objeto JSON con los datos del local")
+        return
+    try:
+        sample_rate = int(inicio.get("sample_rate", 16000))
+    except (TypeError, ValueError):
+        sample_rate = None
+    if sample_rate != 16000:
+        _enviar_error(ws, "Solo se acepta PCM s16le mono a 16 kHz")
+        return
+
+    local = {c: inicio.get(c) or session.get(c) for c in CAMPOS_LOCAL}
+    transcriptor = TranscriptorStreaming(obtener_modelo(MODELO_STREAMING), paso_seg=PASO_SEG, ventana_max_seg=VENTANA_SEG)
+    acumulado = []
+    ultimo_flush = time.monotonic()
+    ws.send(json.dumps({"type": "ready"}))
+
+    def flush(forzar=False):
+        # Las frases confirmadas se agrupan para no llamar al LLM por cada palabra
+        nonlocal ultimo_flush
+        texto = "".join(acumulado).strip()
+        if not texto:
+            return
+        if forzar or texto.endswith((".", "?", "!")) or time.monotonic() - ultimo_flush >= FLUSH_SEG:
+            procesar_transcripcion(texto, local)
+            acumulado.clear()
+            ultimo_flush = time.monotonic()
+
+    try:
+        while True:
+            mensaje = ws.receive()
+            if mensaje is None:
+                break
+            if isinstance(mensaje, str):
+                control = _leer_json(mensaje)
+                if control is None:
+                    _enviar_error(ws, "Mensaje de control inválido: se esperaba un objeto JSON")
+                elif control.get("event") == "end":
+                    break
+                continue
+
+            resultado = en_hilo_nativo(transcriptor.agregar_pcm, mensaje)
+            if resultado is None:
+                continue
+            final, parcial = resultado
+            if final:
+                ws.send(json.dumps({"type": "final", "text": final}))
+                acumulado.append(" " + final)
+                flush()
+            ws.send(json.dumps({"type": "partial", "text": parcial}))
+
+        final = en_hilo_nativo(transcriptor.finalizar)
+        if final:
+            ws.send(json.dumps({"type": "final", "text": final}))
+            acumulado.append(" " + final)
+        ws.send(json.dumps({"type": "end"}))
+    except ConnectionClosed:
+        final = en_hilo_nativo(transcriptor.finalizar)
+        if final:
+            acumulado.append(" " + final)
+    finally:
+        flush(forzar=True)
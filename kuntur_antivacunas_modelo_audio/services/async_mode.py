@@ -0,0 +1,43 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODO = os.getenv("SERVER_ASYNC_MODE", "threading")   # threading | gevent
+HILOS_NATIVOS = int(os.getenv("GEVENT_THREADPOOL_SIZE", "16"))
+
+_gevent = None
+
+
+def parchear():
+    """Con SERVER_ASYNC_MODE=gevent, aplica el monkey patching (debe llamarse antes de importar el resto)."""
+    if MODO == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def gevent_activo():
+    global _gevent
+    if _gevent is None:
+        try:
+            from gevent import monkey
+            _gevent = monkey.is_module_patched("threading")
+        except ImportError:
+            _gevent = False
+    return _gevent
+
+
+def en_hilo_nativo(funcion, *args, **kwargs):
+    """
+    Con gevent, el código nativo que no cede el control (Whisper, PyAV,
+    OpenCV) se ejecuta en un hilo real del threadpool del hub para no
+    bloquear a los demás clientes. Sin gevent, se llama directamente.
+    """
+    if not gevent_activo():
+        return funcion(*args, **kwargs)
+    from gevent import get_hub
+    pool = get_hub().threadpool
+    if pool.maxsize < HILOS_NATIVOS:
+        pool.maxsize = HILOS_NATIVOS
+    return pool.apply(funcion, args, kwargs)
@@ -0,0 +1,52 @@
+import io
+import wave
+from typing import Optional
+
+import numpy as np
+from faster_whisper import decode_audio
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def pcm16_a_float32(pcm: bytes, canales: int = 1) -> np.ndarray:
+    """Convierte PCM s16le (intercalado) en un array float32 mono en [-1, 1]."""
+    muestras = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    if canales > 1:
+        muestras = muestras[: len(muestras) - len(muestras) % canales]
+        muestras = muestras.reshape(-1, canales).mean(axis=1)
+    return muestras
+
+
+def decodificar_wav_nativo(datos: bytes) -> Optional[np.ndarray]:
+    """
+    Ruta rápida para WAV PCM 16-bit a 16 kHz (lo que envía captura_audio):
+    se decodifica directamente con NumPy, sin ffmpeg/PyAV ni archivos.
+    Devuelve None si el audio no está en ese formato.
+    """
+    if datos[:4] != b"RIFF" or datos[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(datos), "rb") as wf:
+            if wf.getsampwidth() != 2 or wf.getframerate() != WHISPER_SAMPLE_RATE:
+                return None
+            canales = wf.getnchannels()
+            pcm = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    return pcm16_a_float32(pcm, canales)
+
+
+def decodificar_audio(datos: bytes) -> np.ndarray:
+    """
+    Decodifica el audio subido a float32 mono 16 kHz sin tocar disco.
+    WAV 16 kHz va por la ruta NumPy; el resto (FLAC, Opus, WebM, WAV a otra
+    frecuencia) lo decodifica PyAV desde un buffer en memoria propio del request.
+    Lanza ValueError si el audio no se puede decodificar.
+    """
+    audio = decodificar_wav_nativo(datos)
+    if audio is not None:
+        return audio
+    try:
+        return decode_audio(io.BytesIO(datos), sampling_rate=WHISPER_SAMPLE_RATE)
+    except Exception as e:
+        raise ValueError(f"Audio no decodificable: {e}") from e
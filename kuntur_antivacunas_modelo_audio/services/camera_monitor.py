@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+from dotenv import load_dotenv
+
+from services.async_mode import en_hilo_nativo
+from services.db import coleccion_usuarios
+from services.video_buffer import grabadores, url_video_camara
+
+load_dotenv()
+
+INTERVALO_SEG = float(os.getenv("CAMERA_PROBE_INTERVAL_SEC", "30"))     # Sondeo de una cámara sana
+BACKOFF_MAX_SEG = float(os.getenv("CAMERA_PROBE_BACKOFF_MAX_SEC", "300"))
+TIMEOUT_SEG = float(os.getenv("CAMERA_PROBE_TIMEOUT_SEC", "5"))
+TRABAJADORES = int(os.getenv("CAMERA_PROBE_WORKERS", "4"))
+REFRESCO_LISTA_SEG = float(os.getenv("CAMERA_LIST_REFRESH_SEC", "300"))  # Relectura de cámaras en Mongo
+FRAMES_MUESTRA = 5
+
+
+def _abrir(url):
+    timeout_ms = int(TIMEOUT_SEG * 1000)
+    if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        return cv2.VideoCapture(url, cv2.CAP_ANY, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms
+        ])
+    return cv2.VideoCapture(url)
+
+
+def sondear_camara(url):
+    """Abre la cámara, lee unos frames y mide latencia hasta el primero y fps."""
+    inicio = time.monotonic()
+    cap = _abrir(url)
+    try:
+        if not cap.isOpened() or not cap.read()[0]:
+            return {"activa": False}
+        primero = time.monotonic()
+        leidos = 1
+        while leidos < FRAMES_MUESTRA and cap.read()[0]:
+            leidos += 1
+        fin = time.monotonic()
+        return {
+            "activa": True,
+            "latencia_ms": round((primero - inicio) * 1000, 1),
+            "fps": round((leidos - 1) / (fin - primero), 1) if leidos > 1 and fin > primero else None
+        }
+    finally:
+        cap.release()
+
+
+class MonitorCamaras:
+    """
+    Sondea en segundo plano las cámaras registradas (`ip_camara` de la
+    colección `user`) y guarda su estado en memoria: /estado_camara responde
+    desde ahí sin tocar la cámara. Las cámaras caídas se sondean cada vez
+    menos (backoff exponencial hasta BACKOFF_MAX_SEG). Cada cámara se indexa
+    por su URL canónica, como en los grabadores: si ya tiene un grabador
+    compartido conectado, se usa su información en lugar de abrir otra
+    conexión.
+    """
+
+    def __init__(self, intervalo=INTERVALO_SEG, backoff_max=BACKOFF_MAX_SEG, trabajadores=TRABAJADORES):
+        self.intervalo = intervalo
+        self.backoff_max = backoff_max
+        self._camaras = {}   # url -> estado
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, trabajadores), thread_name_prefix="sondeo-camara")
+        self._iniciado = False
+        self._ultima_lista = 0.0
+        self.sondeos = 0
+
+    def iniciar(self):
+        with self._lock:
+            if self._iniciado:
+                return
+            self._iniciado = True
+        threading.Thread(target=self._bucle, name="monitor-camaras", daemon=True).start()
+
+    def registrar(self, url):
+        """Añade una cámara al monitor (sondeo inmediato)."""
+        url = url_video_camara(url)
+        if not url:
+            return
+        with self._lock:
+            if url not in self._camaras:
+                self._camaras[url] = {
+                    "estado": "verificando",
+                    "ultima_vez_activa": None,
+                    "fps": None,
+                    "latencia_ms": None,
+                    "fallos": 0,
+                    "ultimo_sondeo": None,
+                    "_proximo": 0.0,
+                    "_en_curso": False
+                }
+
+    def _cargar_camaras(self):
+        try:
+            for url in coleccion_usuarios.distinct("ip_camara"):
+                self.registrar(url)
+        except Exception as e:
+            print(f"⚠️ No se pudo leer la lista de cámaras: {e}")
+        self._ultima_lista = time.monotonic()
+
+    def _bucle(self):
+        while True:
+            if time.monotonic() - self._ultima_lista > REFRESCO_LISTA_SEG:
+                self._cargar_camaras()
+            ahora = time.monotonic()
+            with self._lock:
+                pendientes = [u for u, c in self._camaras.items() if not c["_en_curso"] and c["_proximo"] <= ahora]
+                for url in pendientes:
+                    self._camaras[url]["_en_curso"] = True
+            for url in pendientes:
+                self._pool.submit(self._sondear, url)
+            time.sleep(1.0)
+
+    def _sondear(self, url):
+        grabador = grabadores.obtener(url)
+        try:
+            if grabador is not None and grabador.conectada and grabador.frames:
+                resultado = self._desde_grabador(grabador)
+            else:
+                resultado = en_hilo_nativo(sondear_camara, url)
+        except Exception as e:
+            print(f"⚠️ Error sondeando {url}: {e}")
+            resultado = {"activa": False}
+
+        ahora = time.monotonic()
+        with self._lock:
+            camara = self._camaras[url]
+            camara["_en_curso"] = False
+            camara["ultimo_sondeo"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.sondeos += 1
+            if resultado["activa"]:
+                camara.update({
+                    "estado": "activa",
+                    "ultima_vez_activa": camara["ultimo_sondeo"],
+                    "fps": resultado.get("fps"),
+                    "latencia_ms": resultado.get("latencia_ms"),
+                    "fallos": 0,
+                    "_proximo": ahora + self.intervalo
+                })
+            else:
+                camara["estado"] = "inactiva"
+                camara["fallos"] += 1
+                camara["_proximo"] = ahora + min(self.backoff_max, self.intervalo * 2 ** camara["fallos"])
+
+    @staticmethod
+    def _desde_grabador(grabador):
+        frames = list(grabador.frames)
+        ultimo = frames[-1][0]
+        if time.time() - ultimo > TIMEOUT_SEG:
+            return {"activa": False}
+        recientes = [t for t, _ in frames if ultimo - t <= 5]
+        duracion = recientes[-1] - recientes[0] if len(recientes) > 1 else 0
+        return {
+            "activa": True,
+            "latencia_ms": None,
+            "fps": round((len(recientes) - 1) / duracion, 1) if duracion > 0 else None
+        }
+
+    def estado_camara(self, url):
+        """Estado en caché de una cámara (sin sondearla en el request)."""
+        url = url_video_camara(url)
+        with self._lock:
+            camara = self._camaras.get(url)
+            if camara is not None:
+                return {k: v for k, v in camara.items() if not k.startswith("_")}
+        self.registrar(url)
+        return {"estado": "verificando"}
+
+    def estado(self):
+        with self._lock:
+            estados = [c["estado"] for c in self._camaras.values()]
+        return {
+            "camaras": len(estados),
+            "activas": estados.count("activa"),
+            "inactivas": estados.count("inactiva"),
+            "sondeos": self.sondeos
+        }
+
+
+monitor_camaras = MonitorCamaras()
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from dotenv import load_dotenv
+
+from services.video_buffer import url_video_camara
+
+load_dotenv()
+
+VENTANA_SEG = float(os.getenv("CONTEXT_WINDOW_SEC", "30"))      # Texto reciente que se evalúa junto
+INCIDENTE_SEG = float(os.getenv("INCIDENT_TTL_SEC", "120"))     # Sin nuevas detecciones en este tiempo, el incidente termina
+MAX_SITIOS = int(os.getenv("CONTEXT_MAX_SITES", "1000"))
+
+
+class _VentanaSitio:
+    def __init__(self):
+        self.fragmentos = deque()   # (llegada, texto)
+        self.version = 0
+        self.evaluada = 0
+        self.ultimo_uso = time.monotonic()
+        self.incidente_id = None
+        self.incidente_hasta = 0.0
+
+
+class VentanasContexto:
+    """
+    Ventana deslizante de transcripción por sitio (últimos `ventana_seg`).
+    Cada fragmento nuevo se añade al final y lo antiguo se descarta; la
+    amenaza se evalúa sobre el texto de toda la ventana, así una extorsión
+    partida en varios fragmentos se ve completa. Solo hay algo que evaluar
+    si llegó texto desde la última evaluación, y las detecciones de un mismo
+    incidente en curso no generan alertas repetidas.
+    """
+
+    def __init__(self, ventana_seg=VENTANA_SEG, incidente_seg=INCIDENTE_SEG, max_sitios=MAX_SITIOS):
+        self.ventana_seg = ventana_seg
+        self.incidente_seg = incidente_seg
+        self.max_sitios = max_sitios
+        self._sitios = {}
+        self._lock = threading.Lock()
+        self.evaluaciones = 0
+        self.omitidas = 0
+        self.alertas = 0
+        self.duplicadas = 0
+
+    def _ventana(self, sitio, ahora):
+        ventana = self._sitios.get(sitio)
+        if ventana is None:
+            if len(self._sitios) >= self.max_sitios:
+                inactivo = min(self._sitios, key=lambda s: self._sitios[s].ultimo_uso)
+                del self._sitios[inactivo]
+            ventana = self._sitios[sitio] = _VentanaSitio()
+        ventana.ultimo_uso = ahora
+        return ventana
+
+    def _recortar(self, ventana, ahora):
+        while ventana.fragmentos and ahora - ventana.fragmentos[0][0] > self.ventana_seg:
+            ventana.fragmentos.popleft()
+
+    def agregar(self, sitio, texto):
+        """Añade el texto de un fragmento. Devuelve False si no había texto nuevo."""
+        texto = (texto or "").strip()
+        if not texto:
+            return False
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self._ventana(sitio, ahora)
+            ventana.fragmentos.append((ahora, texto))
+            self._recortar(ventana, ahora)
+            ventana.version += 1
+        return True
+
+    def pendiente(self, sitio):
+        """
+        Si hay fragmentos sin evaluar, devuelve el texto de la ventana y los
+        marca como evaluados; None si otro trabajo ya evaluó lo último que llegó.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self._sitios.get(sitio)
+            if ventana is None or ventana.version == ventana.evaluada:
+                self.omitidas += 1
+                return None
+            self._recortar(ventana, ahora)
+            ventana.evaluada = ventana.version
+            self.evaluaciones += 1
+            return " ".join(t for _, t in ventana.fragmentos)
+
+    def registrar_alerta(self, sitio):
+        """
+        Registra una detección. Devuelve (nueva, incidente_id): `nueva` es False
+        si el sitio ya tiene un incidente en curso (la detección lo prolonga).
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self._ventana(sitio, ahora)
+            nueva = ventana.incidente_id is None or ahora > ventana.incidente_hasta
+            if nueva:
+                ventana.incidente_id = str(uuid.uuid4())
+                self.alertas += 1
+            else:
+                self.duplicadas += 1
+            ventana.incidente_hasta = ahora + self.incidente_seg
+            return nueva, ventana.incidente_id
+
+    def estado(self):
+        ahora = time.monotonic()
+        with self._lock:
+            activos = sum(1 for v in self._sitios.values() if v.incidente_id and ahora <= v.incidente_hasta)
+            return {
+                "ventana_seg": self.ventana_seg,
+                "sitios": len(self._sitios),
+                "incidentes_activos": activos,
+                "evaluaciones": self.evaluaciones,
+                "evaluaciones_omitidas": self.omitidas,
+                "alertas": self.alertas,
+                "alertas_duplicadas": self.duplicadas
+            }
+
+
+def clave_sitio(local):
+    """
+    Sitio del local: el `sitio` que envía captura_audio (id de su sesión de
+    captura) o, si no viene, la URL canónica de su cámara o su nombre.
+    """
+    return (local.get("sitio") or url_video_camara(local.get("ip_camara"))
+            or local.get("nombre_local") or "desconocido")
+
+
+ventanas = VentanasContexto()
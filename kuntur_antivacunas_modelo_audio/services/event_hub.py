@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_COLA = int(os.getenv("SSE_QUEUE_MAX", "100"))       # Eventos pendientes por panel conectado
+HISTORIAL = int(os.getenv("SSE_HISTORY", "500"))        # Eventos recientes para reenviar con Last-Event-ID
+
+
+class Suscripcion:
+    """Cola acotada de un panel conectado: si el panel va lento, se descartan los eventos más antiguos."""
+
+    def __init__(self, sitio, max_cola):
+        self.sitio = sitio
+        self.eventos = deque(maxlen=max_cola)
+        self.descartados = 0
+        self._cond = threading.Condition()
+
+    def _entregar(self, evento):
+        with self._cond:
+            if len(self.eventos) == self.eventos.maxlen:
+                self.descartados += 1
+            self.eventos.append(evento)
+            self._cond.notify()
+
+    def esperar(self, timeout):
+        """Devuelve los eventos pendientes (lista vacía si no llegó nada en `timeout`)."""
+        with self._cond:
+            if not self.eventos:
+                self._cond.wait(timeout)
+            pendientes = list(self.eventos)
+            self.eventos.clear()
+            return pendientes
+
+
+class HubEventos:
+    """
+    Difusión de eventos a todos los paneles conectados por SSE. Cada panel
+    tiene su propia cola (todos reciben cada evento) y puede filtrar por
+    sitio. Los últimos eventos se guardan en un anillo para que un panel que
+    se reconecta reciba lo que se perdió (cabecera Last-Event-ID).
+    """
+
+    def __init__(self, max_cola=MAX_COLA, historial=HISTORIAL):
+        self.max_cola = max_cola
+        self._historial = deque(maxlen=historial)   # (id, sitio, datos)
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self._ultimo_id = 0
+        self.publicados = 0
+
+    @staticmethod
+    def _coincide(suscripcion_sitio, sitio):
+        return suscripcion_sitio is None or suscripcion_sitio == sitio
+
+    def publicar(self, datos, sitio=None):
+        with self._lock:
+            self._ultimo_id += 1
+            evento = (self._ultimo_id, sitio, datos)
+            self._historial.append(evento)
+            self.publicados += 1
+            destinatarios = [s for s in self._suscripciones if self._coincide(s.sitio, sitio)]
+        for suscripcion in destinatarios:
+            suscripcion._entregar(evento)
+
+    def suscribir(self, sitio=None, ultimo_id=None):
+        suscripcion = Suscripcion(sitio, self.max_cola)
+        with self._lock:
+            if ultimo_id is not None:
+                for evento in self._historial:
+                    if evento[0] > ultimo_id and self._coincide(sitio, evento[1]):
+                        suscripcion._entregar(evento)
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def estado(self):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        return {
+            "suscriptores": len(suscripciones),
+            "publicados": self.publicados,
+            "ultimo_id": self._ultimo_id,
+            "historial": len(self._historial),
+            "descartados": sum(s.descartados for s in suscripciones)
+        }
+
+
+def formato_sse(evento):
+    id_evento, _, datos = evento
+    return f"id: {id_evento}\ndata: {json.dumps(datos)}\n\n"
+
+
+hub = HubEventos()
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from services.db import coleccion_alertas
+
+load_dotenv()
+
+MAX_EVENTOS = int(os.getenv("EVENT_STORE_MAX", "1000"))               # Eventos que se guardan en memoria
+MAX_EDAD_SEG = float(os.getenv("EVENT_STORE_MAX_AGE_SEC", "86400"))    # Más antiguos se consultan en Mongo
+
+
+def _evento_desde_mongo(doc):
+    """Reconstruye el evento del panel a partir de un documento de la colección `alert`."""
+    fecha = doc.get("fecha")
+    return {
+        "id": doc["evento_id"],
+        "texto": doc.get("texto_detectado"),
+        "hora": fecha.strftime("%Y-%m-%d %H:%M:%S") if hasattr(fecha, "strftime") else fecha,
+        "nombre_local": doc.get("nombre_local"),
+        "ubicacion": doc.get("ubicacion"),
+        "ip_camara": doc.get("ip_camara"),
+        "latitud": doc.get("latitud"),
+        "longitud": doc.get("longitud"),
+        "analisis_ia": doc.get("descripcion_alerta"),
+        "nivel_riesgo": doc.get("nivel_riesgo"),
+        "link_evidencia": doc.get("link_evidencia"),
+        "estado_evidencia": doc.get("estado_evidencia")
+    }
+
+
+class AlmacenEventos:
+    """
+    Eventos de alerta indexados por id. En memoria se guardan los más
+    recientes (`max_eventos`, LRU, y nunca más de `max_edad_seg`); un id que
+    ya no está se busca en Mongo por `evento_id` y vuelve a la memoria.
+    """
+
+    def __init__(self, max_eventos=MAX_EVENTOS, max_edad_seg=MAX_EDAD_SEG):
+        self.max_eventos = max(1, max_eventos)
+        self.max_edad = max_edad_seg
+        self._eventos = OrderedDict()   # id -> (guardado, evento)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.lecturas_mongo = 0
+        self.no_encontrados = 0
+
+    def agregar(self, evento):
+        with self._lock:
+            self._guardar(evento["id"], evento)
+
+    def _guardar(self, evento_id, evento):
+        self._eventos[evento_id] = (time.monotonic(), evento)
+        self._eventos.move_to_end(evento_id)
+        limite = time.monotonic() - self.max_edad
+        while self._eventos:
+            primero, (guardado, _) = next(iter(self._eventos.items()))
+            if len(self._eventos) <= self.max_eventos and guardado >= limite:
+                break
+            del self._eventos[primero]
+
+    def actualizar(self, evento_id, **campos):
+        """Aplica `campos` al evento en memoria (si sigue ahí) y a su alerta en Mongo."""
+        with self._lock:
+            entrada = self._eventos.get(evento_id)
+            if entrada is not None:
+                entrada[1].update(campos)
+        try:
+            coleccion_alertas.update_one({"evento_id": evento_id}, {"$set": campos})
+        except Exception as e:
+            print(f"⚠️ No se pudo actualizar la alerta {evento_id} en Mongo: {e}")
+
+    def obtener(self, evento_id):
+        with self._lock:
+            entrada = self._eventos.get(evento_id)
+            if entrada is not None and time.monotonic() - entrada[0] <= self.max_edad:
+                self._eventos.move_to_end(evento_id)
+                self.aciertos += 1
+                return entrada[1]
+
+        try:
+            doc = coleccion_alertas.find_one({"evento_id": evento_id})
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar la alerta {evento_id} en Mongo: {e}")
+            doc = None
+        if doc is None:
+            self.no_encontrados += 1
+            return None
+
+        evento = _evento_desde_mongo(doc)
+        with self._lock:
+            self.lecturas_mongo += 1
+            self._guardar(evento_id, evento)
+        return evento
+
+    def estado(self):
+        return {
+            "en_memoria": len(self._eventos),
+            "max_eventos": self.max_eventos,
+            "aciertos": self.aciertos,
+            "lecturas_mongo": self.lecturas_mongo,
+            "no_encontrados": self.no_encontrados
+        }
+
+
+def asegurar_indices():
+    """Índice por evento_id para que la lectura desde Mongo no recorra la colección."""
+    try:
+        coleccion_alertas.create_index("evento_id", unique=True, sparse=True)
+    except Exception as e:
+        print(f"⚠️ No se pudo crear el índice evento_id en Mongo: {e}")
+
+
+eventos_detectados = AlmacenEventos()
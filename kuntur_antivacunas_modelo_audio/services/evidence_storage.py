@@ -0,0 +1,213 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKEND = os.getenv("EVIDENCE_BACKEND", "b2")                 # b2 | s3 (MinIO u otro compatible, para pruebas)
+TRABAJADORES = int(os.getenv("UPLOAD_WORKERS", "2"))          # Subidas en paralelo
+UMBRAL_STREAM_MB = float(os.getenv("UPLOAD_STREAM_THRESHOLD_MB", "10"))  # S3: desde aquí, subida por partes
+B2_DOWNLOAD_URL = os.getenv("B2_DOWNLOAD_URL", "https://f005.backblazeb2.com")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://localhost:9000")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "")
+
+
+def _tamano(datos):
+    if isinstance(datos, (bytes, bytearray, memoryview)):
+        return len(datos)
+    return datos.getbuffer().nbytes
+
+
+def _vista(datos):
+    """Vista de solo lectura sobre los bytes o el BytesIO, sin copiarlos."""
+    if isinstance(datos, (bytes, bytearray, memoryview)):
+        return memoryview(datos).cast("B")
+    return datos.getbuffer().toreadonly()
+
+
+class _LectorMemoria(io.RawIOBase):
+    """Lee una vista en memoria por trozos: cada `read` copia solo su trozo, nunca el buffer entero."""
+
+    def __init__(self, vista):
+        self._vista = vista
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._vista)}[whence]
+        self._pos = min(max(0, base + pos), len(self._vista))
+        return self._pos
+
+    def readinto(self, destino):
+        n = min(len(destino), len(self._vista) - self._pos)
+        destino[:n] = self._vista[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+class _AlmacenB2:
+    """Cliente B2 autorizado una sola vez; b2sdk renueva el token por su cuenta cuando expira."""
+
+    def __init__(self, bucket_name, key_id, app_key):
+        self.bucket_name = bucket_name
+        self._key_id = key_id
+        self._app_key = app_key
+        self._api = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def _bucket_autorizado(self, renovar=False):
+        with self._lock:
+            if self._bucket is None or renovar:
+                import b2sdk.v2
+                self._api = b2sdk.v2.B2Api(b2sdk.v2.InMemoryAccountInfo())
+                self._api.authorize_account("production", self._key_id, self._app_key)
+                self._bucket = self._api.get_bucket_by_name(self.bucket_name)
+                print(f"🔑 B2 autorizado para {self.bucket_name}")
+            return self._bucket
+
+    def subir(self, datos, file_name, content_type):
+        from b2sdk.v2 import UploadSourceStream
+        from b2sdk.v2.exception import InvalidAuthToken, Unauthorized
+        # Se sube leyendo de una vista del buffer (sin copiarlo); b2sdk decide
+        # si va en una sola petición o por partes, y reabre el lector si reintenta
+        vista = _vista(datos)
+        origen = UploadSourceStream(
+            lambda: _LectorMemoria(vista),
+            stream_length=len(vista),
+            stream_sha1=hashlib.sha1(vista).hexdigest()
+        )
+        try:
+            self._bucket_autorizado().upload(origen, file_name, content_type=content_type)
+        except (InvalidAuthToken, Unauthorized):
+            # Credenciales caducadas o revocadas: se autoriza de nuevo una vez
+            self._bucket_autorizado(renovar=True).upload(origen, file_name, content_type=content_type)
+
+    def url(self, file_name):
+        return f"{B2_DOWNLOAD_URL}/file/{self.bucket_name}/{file_name}"
+
+
+class _AlmacenS3:
+    """Almacén compatible con S3 (MinIO local para pruebas). Requiere boto3."""
+
+    def __init__(self, bucket_name, key_id=None, app_key=None):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        self.bucket_name = bucket_name
+        self._cliente = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=S3_ACCESS_KEY or key_id,
+            aws_secret_access_key=S3_SECRET_KEY or app_key
+        )
+        umbral = int(UMBRAL_STREAM_MB * 1024 * 1024)
+        self._config = TransferConfig(multipart_threshold=umbral, multipart_chunksize=max(umbral, 5 * 1024 * 1024))
+
+    def subir(self, datos, file_name, content_type):
+        if isinstance(datos, (bytes, bytearray, memoryview)):
+            datos = io.BytesIO(datos)
+        self._cliente.upload_fileobj(datos, self.bucket_name, file_name,
+                                     ExtraArgs={"ContentType": content_type}, Config=self._config)
+
+    def url(self, file_name):
+        base = S3_PUBLIC_URL or f"{S3_ENDPOINT_URL}/{self.bucket_name}"
+        return f"{base.rstrip('/')}/{file_name}"
+
+
+class SubidorEvidencias:
+    """
+    Servicio de subida de larga vida: un cliente autorizado por bucket,
+    reutilizado entre subidas, y un pool de hilos para subir en segundo plano.
+    """
+
+    def __init__(self, backend=BACKEND, trabajadores=TRABAJADORES):
+        self.backend = backend
+        self._almacenes = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, trabajadores), thread_name_prefix="subida")
+        self.subidas = 0
+        self.errores = 0
+        self.en_curso = 0
+        self.bytes_subidos = 0
+        self._duraciones = deque(maxlen=100)
+
+    def _almacen(self, bucket_name, key_id, app_key):
+        clave = (bucket_name, key_id)
+        with self._lock:
+            almacen = self._almacenes.get(clave)
+            if almacen is None:
+                if self.backend == "s3":
+                    almacen = _AlmacenS3(bucket_name, key_id, app_key)
+                elif self.backend == "b2":
+                    almacen = _AlmacenB2(bucket_name, key_id, app_key)
+                else:
+                    raise ValueError(f"EVIDENCE_BACKEND no soportado: {self.backend} (usa 'b2' o 's3')")
+                self._almacenes[clave] = almacen
+            return almacen
+
+    def url(self, bucket_name, key_id, app_key, file_name):
+        return self._almacen(bucket_name, key_id, app_key).url(file_name)
+
+    def subir(self, datos, file_name, bucket_name, key_id, app_key, content_type="video/mp4"):
+        """Sube `datos` (bytes o BytesIO) y devuelve la URL pública."""
+        almacen = self._almacen(bucket_name, key_id, app_key)
+        tamano = _tamano(datos)
+        inicio = time.monotonic()
+        with self._lock:
+            self.en_curso += 1
+        try:
+            almacen.subir(datos, file_name, content_type)
+        except Exception:
+            with self._lock:
+                self.errores += 1
+            raise
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+        with self._lock:
+            self.subidas += 1
+            self.bytes_subidos += tamano
+            self._duraciones.append(time.monotonic() - inicio)
+        return almacen.url(file_name)
+
+    def subir_en_segundo_plano(self, datos, file_name, bucket_name, key_id, app_key, content_type="video/mp4"):
+        """Encola la subida en el pool; devuelve un Future con la URL."""
+        def _tarea():
+            try:
+                url = self.subir(datos, file_name, bucket_name, key_id, app_key, content_type)
+                print(f"📼 Evidencia subida: {file_name}")
+                return url
+            except Exception as e:
+                print(f"⚠️ Error subiendo {file_name}: {e}")
+                raise
+        return self._pool.submit(_tarea)
+
+    def estado(self):
+        duraciones = sorted(self._duraciones)
+        return {
+            "backend": self.backend,
+            "subidas": self.subidas,
+            "errores": self.errores,
+            "en_curso": self.en_curso,
+            "mb_subidos": round(self.bytes_subidos / (1024 * 1024), 2),
+            "duracion_p50_ms": round(duraciones[len(duraciones) // 2] * 1000, 1) if duraciones else None
+        }
+
+
+subidor = SubidorEvidencias()
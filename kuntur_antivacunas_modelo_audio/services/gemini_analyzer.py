@@ -1,44 +1,77 @@
 from datetime import datetime
-from services.gemini_provider import get_llm
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
+from services.gemini_provider import pool
 from langchain.prompts import ChatPromptTemplate
+from services.llm_cache import cache_analisis
+
+
+class AnalisisAmenaza(BaseModel):
+    """Respuesta estructurada del LLM: detección y análisis en una sola llamada."""
+    es_amenaza: bool = Field(description="true si el texto es una amenaza real (extorsión, intimidación, coacción, etc.)")
+    nivel_riesgo: Literal["BAJO", "MEDIO", "ALTO", "CRÍTICO"] = Field(description="Nivel de riesgo")
+    resumen: str = Field(description="Resumen breve de la situación, tono profesional")
+    recomendacion: str = Field(description="Recomendación básica de acción")
+
+    def como_parrafo(self, texto):
+        """Párrafo para el panel, Mongo y la UPC (mismo contenido que el análisis libre anterior)."""
+        return f'{self.resumen} Nivel de riesgo: {self.nivel_riesgo}. Recomendación: {self.recomendacion} "{texto}"'
+
 
 prompt_template = ChatPromptTemplate.from_messages([
     ("human", """
-    Eres un analista de seguridad especializado en evaluar amenazas de audio.
-    
-    CONTEXTO:
-    - Se detectó una posible amenaza en una transcripción de audio
-    - Hora de detección: {hora}
-    - Texto transcrito: "{texto_original}"
-    
+    Eres un analista de seguridad especializado en detectar y evaluar amenazas en transcripciones de audio
+    de locales comerciales.
+
+    Texto transcrito: "{texto}"
+
     TAREA:
-    Analiza el texto y genera UN SOLO PÁRRAFO que incluya:
-    - Resumen de la amenaza detectada.
+    - Indica si representa una amenaza real (extorsión, intimidación, coacción, etc.) o si es inofensivo.
     - Nivel de riesgo (BAJO/MEDIO/ALTO/CRÍTICO).
+    - Resumen de la situación en máximo 2 líneas.
     - Recomendación básica de acción.
-    - Texto original al final entre comillas.
-
-    Máximo 4 líneas, tono profesional.
     """)
 ])
 
-def procesar_evento_con_ia(evento):
+
+def analizar_texto(texto: str) -> Optional[AnalisisAmenaza]:
+    """
+    Una sola llamada a Gemini con salida JSON validada contra AnalisisAmenaza,
+    acotada por GEMINI_DEADLINE_SEC. Devuelve None si el LLM falla, no responde
+    a tiempo o su respuesta no cumple el esquema.
+    """
+    # Misma frase (normalizada) ya analizada: se reutiliza el análisis
+    cacheado = cache_analisis.obtener(texto)
+    if cacheado is not None:
+        return AnalisisAmenaza.model_validate(cacheado)
     try:
-        llm = get_llm()
-        prompt = prompt_template.format_messages(
-            hora=evento['hora'],
-            texto_original=evento['texto']
-        )
-        response = llm.invoke(prompt)
-        evento.update({
-            'analisis_ia': response.content,
-            'timestamp_analisis': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        return evento
+        analisis = pool.invocar_con_plazo(prompt_template.format_messages(texto=texto), esquema=AnalisisAmenaza)
+        if not isinstance(analisis, AnalisisAmenaza):
+            analisis = AnalisisAmenaza.model_validate(analisis)
+    except ValidationError as e:
+        print(f"❌ Respuesta de Gemini fuera del esquema: {e}")
+        return None
     except Exception as e:
         print(f"❌ Error específico en Gemini: {type(e).__name__}: {e}")
+        return None
+    cache_analisis.guardar(texto, analisis.model_dump())  # Los errores no se guardan
+    return analisis
+
+
+def aplicar_analisis(evento, analisis: Optional[AnalisisAmenaza]):
+    """Completa el evento con el análisis (o con valores por defecto si no hay)."""
+    if analisis is None:
+        evento.update({'analisis_ia': "No disponible", 'nivel_riesgo': "MEDIO"})
+    else:
         evento.update({
-            'analisis_ia': f"❌ Error: {str(e)}",
-            'timestamp_analisis': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            'analisis_ia': analisis.como_parrafo(evento['texto']),
+            'nivel_riesgo': analisis.nivel_riesgo,
+            'resumen': analisis.resumen,
+            'recomendacion': analisis.recomendacion
         })
-        return evento
+    evento['timestamp_analisis'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return evento
+
+
+def procesar_evento_con_ia(evento):
+    return aplicar_analisis(evento, analizar_texto(evento['texto']))
@@ -1,23 +1,282 @@
 import os
-import random
-from itertools import cycle
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from services.async_mode import en_hilo_nativo
+
 load_dotenv()
 
-# Cargar todas las API keys desde la variable
-API_KEYS = os.getenv("GOOGLE_API_KEY1", "").split(",")
-api_cycle = cycle(API_KEYS)  # Rotación circular
+MODELO = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+RPM_POR_CLAVE = float(os.getenv("GEMINI_RPM_PER_KEY", "10"))       # Peticiones por minuto de cada clave
+ESPERA_MAX_SEG = float(os.getenv("GEMINI_MAX_WAIT_SEC", "10"))     # Espera máxima por un cupo libre
+ENFRIAMIENTO_SEG = float(os.getenv("GEMINI_COOLDOWN_SEC", "30"))   # Pausa de una clave tras un 429
+ENFRIAMIENTO_MAX_SEG = float(os.getenv("GEMINI_COOLDOWN_MAX_SEC", "300"))
+ERRORES_CIRCUITO = int(os.getenv("GEMINI_BREAKER_ERRORS", "5"))    # Errores seguidos que abren el circuito
+PLAZO_SEG = float(os.getenv("GEMINI_DEADLINE_SEC", "8"))            # Tiempo máximo por llamada (incluye la cobertura)
+COBERTURA = os.getenv("GEMINI_HEDGE", "1") == "1"                  # Duplicar la petición lenta en otra clave
+COBERTURA_MIN_MS = float(os.getenv("GEMINI_HEDGE_MIN_MS", "500"))
+COBERTURA_DEFECTO_MS = float(os.getenv("GEMINI_HEDGE_DELAY_MS", "3000"))  # Mientras no hay latencias medidas
+HILOS_LLAMADAS = int(os.getenv("GEMINI_CALL_THREADS", "16"))
+
+
+def _cargar_claves():
+    """GOOGLE_API_KEY1 (admite lista separada por comas), GOOGLE_API_KEY2, GOOGLE_API_KEY3…"""
+    claves = []
+    nombres = sorted(
+        (n for n in os.environ if re.fullmatch(r"GOOGLE_API_KEY\d+", n)),
+        key=lambda n: int(n[len("GOOGLE_API_KEY"):])
+    )
+    for nombre in nombres:
+        for clave in os.environ[nombre].split(","):
+            clave = clave.strip()
+            if clave and clave not in claves:
+                claves.append(clave)
+    return claves
+
+
+def _es_error_cuota(error):
+    texto = f"{type(error).__name__} {error}".lower()
+    return "resourceexhausted" in texto or "429" in texto or "quota" in texto or "rate limit" in texto
+
+
+class SinClavesDisponibles(RuntimeError):
+    pass
+
+
+class PlazoVencido(TimeoutError):
+    pass
+
+
+class ClienteGemini:
+    """Un cliente por API key, con su cubo de tokens, enfriamiento y estadísticas."""
+
+    def __init__(self, clave, rpm=RPM_POR_CLAVE):
+        self.clave = clave
+        self.llm = ChatGoogleGenerativeAI(
+            model=MODELO,
+            temperature=0.4,
+            convert_system_message_to_human=True,
+            google_api_key=clave,
+            max_retries=1,  # Los reintentos por cuota los hace el pool, en otra clave
+            timeout=PLAZO_SEG * 2  # Tope para las peticiones abandonadas por el plazo
+        )
+        self._estructurados = {}
+        self.capacidad = max(1.0, rpm)
+        self.tokens = self.capacidad
+        self.recarga = rpm / 60.0
+        self._ultima_recarga = time.monotonic()
+        self.enfriado_hasta = 0.0
+        self.errores_seguidos = 0
+        self.cuotas_seguidas = 0
+
+        self.llamadas = 0
+        self.errores = 0
+        self.errores_cuota = 0
+        self._latencias = deque(maxlen=100)
+
+    def runnable(self, esquema=None):
+        if esquema is None:
+            return self.llm
+        if esquema not in self._estructurados:
+            self._estructurados[esquema] = self.llm.with_structured_output(esquema)
+        return self._estructurados[esquema]
+
+    def _recargar(self, ahora):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultima_recarga) * self.recarga)
+        self._ultima_recarga = ahora
+
+    def espera(self, ahora):
+        """Segundos hasta que la clave pueda atender una petición (0 = ya)."""
+        self._recargar(ahora)
+        enfriamiento = max(0.0, self.enfriado_hasta - ahora)
+        falta_token = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.recarga
+        return max(enfriamiento, falta_token)
+
+    def puntuacion(self):
+        """Menor es mejor: errores recientes, latencia media y cupo ya gastado (reparte la carga)."""
+        latencia = sum(self._latencias) / len(self._latencias) if self._latencias else 0.0
+        return self.errores_seguidos * 10 + latencia + (1 - self.tokens / self.capacidad)
 
-def get_llm():
+    def registrar_exito(self, latencia):
+        self.llamadas += 1
+        self.errores_seguidos = 0
+        self.cuotas_seguidas = 0
+        self._latencias.append(latencia)
+
+    def registrar_error(self, error, ahora):
+        self.llamadas += 1
+        self.errores += 1
+        self.errores_seguidos += 1
+        if _es_error_cuota(error):
+            self.errores_cuota += 1
+            self.cuotas_seguidas += 1
+            pausa = min(ENFRIAMIENTO_MAX_SEG, ENFRIAMIENTO_SEG * 2 ** (self.cuotas_seguidas - 1))
+            self.enfriado_hasta = ahora + pausa
+            self.tokens = 0.0
+        elif self.errores_seguidos >= ERRORES_CIRCUITO:
+            self.enfriado_hasta = ahora + ENFRIAMIENTO_SEG  # Circuito abierto
+
+    def estado(self):
+        latencias = sorted(self._latencias)
+        ahora = time.monotonic()
+        return {
+            "clave": f"…{self.clave[-4:]}",
+            "llamadas": self.llamadas,
+            "errores": self.errores,
+            "errores_cuota": self.errores_cuota,
+            "errores_seguidos": self.errores_seguidos,
+            "enfriada_seg": round(max(0.0, self.enfriado_hasta - ahora), 1),
+            "tokens": round(self.tokens, 2),
+            "latencia_p50_ms": round(latencias[len(latencias) // 2] * 1000, 1) if latencias else None,
+            "latencia_p95_ms": round(latencias[int(len(latencias) * 0.95)] * 1000, 1) if latencias else None
+        }
+
+
+class PoolGemini:
     """
-    Devuelve una instancia de ChatGoogleGenerativeAI con la siguiente API key disponible
+    Pool de clientes Gemini, uno por API key. Cada llamada va a la clave más
+    sana con cupo disponible; si una clave devuelve 429 se enfría y la
+    llamada se reintenta en otra.
     """
-    key = next(api_cycle)
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.4,
-        convert_system_message_to_human=True,
-        google_api_key=key
-    )
+
+    def __init__(self, claves):
+        self.clientes = [ClienteGemini(c) for c in claves]
+        self._lock = threading.Lock()
+        self._ejecutor = ThreadPoolExecutor(max_workers=HILOS_LLAMADAS, thread_name_prefix="gemini")
+        self.coberturas = 0
+        self.coberturas_ganadas = 0
+        self.plazos_vencidos = 0
+
+    def _reservar(self, excluir=(), limite=None):
+        """
+        Toma un token de la mejor clave libre, esperando como mucho
+        ESPERA_MAX_SEG o hasta `limite` (monotónico) si llega antes.
+        """
+        tope = time.monotonic() + ESPERA_MAX_SEG
+        limite = tope if limite is None else min(tope, limite)
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                candidatos = [c for c in self.clientes if c not in excluir]
+                if not candidatos:
+                    raise SinClavesDisponibles("No quedan claves de Gemini por probar")
+                esperas = {c: c.espera(ahora) for c in candidatos}
+                libres = [c for c in candidatos if esperas[c] == 0]
+                if libres:
+                    cliente = min(libres, key=lambda c: c.puntuacion())
+                    cliente.tokens -= 1
+                    return cliente
+                espera = min(esperas.values())
+            if ahora + espera > limite:
+                raise SinClavesDisponibles("Todas las claves de Gemini están sin cupo o enfriándose")
+            time.sleep(min(espera, 1.0, max(0.0, limite - ahora)))
+
+    def invocar(self, mensajes, esquema=None, usados=None, cliente=None, limite=None):
+        """
+        Ejecuta la llamada (con salida estructurada si hay `esquema`) en la mejor clave disponible.
+        Las claves de `usados` se evitan, y la clave elegida se añade a esa lista. Si viene
+        `cliente` (ya reservado) se usa en el primer intento; los reintentos no esperan cupo
+        más allá de `limite`.
+        """
+        if not self.clientes:
+            raise SinClavesDisponibles("No hay GOOGLE_API_KEY configuradas")
+        usados = usados if usados is not None else []
+        probados = list(usados)
+        while True:
+            if cliente is None:
+                cliente = self._reservar(excluir=probados, limite=limite)
+                usados.append(cliente)
+            inicio = time.monotonic()
+            try:
+                # gRPC no cede el control a gevent: la llamada va a un hilo real
+                resultado = en_hilo_nativo(cliente.runnable(esquema).invoke, mensajes)
+            except Exception as e:
+                with self._lock:
+                    cliente.registrar_error(e, time.monotonic())
+                if not _es_error_cuota(e):
+                    raise
+                print(f"⚠️ Clave Gemini …{cliente.clave[-4:]} sin cuota; se prueba otra")
+                probados.append(cliente)
+                cliente = None
+                continue
+            with self._lock:
+                cliente.registrar_exito(time.monotonic() - inicio)
+            return resultado
+
+    def retraso_cobertura(self):
+        """p95 de las latencias recientes de todas las claves: a partir de ahí la petición es lenta."""
+        with self._lock:
+            latencias = sorted(l for c in self.clientes for l in c._latencias)
+        if len(latencias) < 20:
+            return COBERTURA_DEFECTO_MS / 1000.0
+        return max(COBERTURA_MIN_MS / 1000.0, latencias[int(len(latencias) * 0.95)])
+
+    def invocar_con_plazo(self, mensajes, esquema=None, plazo_seg=PLAZO_SEG, cobertura=COBERTURA):
+        """
+        Como `invocar`, pero con un plazo total. Si la respuesta tarda más que el
+        p95 habitual, se lanza una copia en otra clave y gana la primera que
+        responda. Lanza PlazoVencido si ninguna responde a tiempo (las peticiones
+        en curso se abandonan; terminan solas en segundo plano).
+        """
+        limite = time.monotonic() + plazo_seg
+        if not self.clientes:
+            raise SinClavesDisponibles("No hay GOOGLE_API_KEY configuradas")
+        # La clave principal se reserva aquí: la cobertura la excluye sin depender
+        # de que el hilo de la principal haya llegado a elegirla
+        principal = self._reservar(limite=limite)
+        usados = [principal]
+        pendientes = {self._ejecutor.submit(self.invocar, mensajes, esquema, usados, principal, limite)}
+        cubierto = not cobertura or len(self.clientes) < 2
+        ultimo_error = None
+
+        while pendientes:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            espera = restante if cubierto else min(restante, self.retraso_cobertura())
+            hechos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if getattr(futuro, "cobertura", False):
+                        with self._lock:
+                            self.coberturas_ganadas += 1
+                    return futuro.result()
+                ultimo_error = futuro.exception()
+
+            if not cubierto and (pendientes or ultimo_error is not None):
+                # Primera petición lenta (o fallida): copia en otra clave
+                cubierto = True
+                with self._lock:
+                    self.coberturas += 1
+                copia = self._ejecutor.submit(self.invocar, mensajes, esquema, list(usados), None, limite)
+                copia.cobertura = True
+                pendientes = pendientes | {copia}
+
+        if pendientes:
+            with self._lock:
+                self.plazos_vencidos += 1
+            raise PlazoVencido(f"Gemini no respondió en {plazo_seg:.1f}s")
+        raise ultimo_error
+
+    def estado(self):
+        retraso = self.retraso_cobertura()
+        with self._lock:
+            return {
+                "modelo": MODELO,
+                "plazo_seg": PLAZO_SEG,
+                "cobertura": COBERTURA,
+                "retraso_cobertura_ms": round(retraso * 1000, 1),
+                "coberturas": self.coberturas,
+                "coberturas_ganadas": self.coberturas_ganadas,
+                "plazos_vencidos": self.plazos_vencidos,
+                "claves": [c.estado() for c in self.clientes]
+            }
+
+
+pool = PoolGemini(_cargar_claves())
+
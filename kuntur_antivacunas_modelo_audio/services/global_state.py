@@ -1,5 +0,0 @@
-import queue
-
-event_queue = queue.Queue()
-eventos_detectados = []
-
@@ -0,0 +1,204 @@
+import os
+import queue
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from dotenv import load_dotenv
+from faster_whisper import BatchedInferencePipeline, __version__ as FW_VERSION
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from services.audio_decoder import WHISPER_SAMPLE_RATE
+from services.whisper_registry import obtener_modelo, NUM_WORKERS
+from services.async_mode import en_hilo_nativo
+
+load_dotenv()
+
+MAX_LOTE = int(os.getenv("WHISPER_BATCH_MAX", "8"))               # Fragmentos por lote
+ESPERA_MAX_MS = float(os.getenv("WHISPER_BATCH_WAIT_MS", "100"))  # Espera máxima para completar un lote
+BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+MAX_CLIP_SEG = 30.0  # Whisper decodifica ventanas de 30 s: lo más largo va por la ruta normal
+
+
+def _clips_en_segundos() -> bool:
+    """
+    faster-whisper < 1.2 recorta cada clip con audio[start:end] (muestras
+    enteras); desde 1.2 recibe segundos y los convierte él mismo.
+    """
+    try:
+        return tuple(int(p) for p in FW_VERSION.split(".")[:2]) >= (1, 2)
+    except ValueError:
+        return True
+
+
+class PlanificadorInferencia:
+    """
+    Agrupa los fragmentos que llegan casi a la vez (hasta `max_lote` o
+    `espera_max_ms`) y los decodifica en una sola pasada por lotes de
+    faster-whisper: los audios se concatenan y cada uno se pasa como un
+    `clip_timestamps` independiente del BatchedInferencePipeline.
+    """
+
+    def __init__(self, max_lote=MAX_LOTE, espera_max_ms=ESPERA_MAX_MS, hilos=NUM_WORKERS,
+                 idioma="es", beam_size=BEAM_SIZE):
+        self.max_lote = max(1, max_lote)
+        self.espera_max = espera_max_ms / 1000.0
+        self.hilos = max(1, hilos)
+        self.idioma = idioma
+        self.beam_size = beam_size
+        self.vad = VadOptions()
+
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._pipeline = None
+        self._batch_disponible = True
+        self._iniciado = False
+
+        self.lotes = 0
+        self.fragmentos = 0
+        self.sin_voz = 0
+        self._tamanos = deque(maxlen=200)
+        self._latencias = deque(maxlen=200)
+
+    # ------------------------------------------------------------------ API
+    def transcribir(self, audio: np.ndarray) -> str:
+        """Encola el audio y espera su texto (se bloquea solo el hilo del request)."""
+        if self.max_lote == 1:
+            return en_hilo_nativo(self._transcribir_uno, audio)
+        self._iniciar()
+        futuro = Future()
+        self._cola.put((audio, futuro, time.perf_counter()))
+        return futuro.result()
+
+    def estado(self) -> dict:
+        tamanos = list(self._tamanos)
+        latencias = sorted(self._latencias)
+        return {
+            "max_lote": self.max_lote,
+            "espera_max_ms": self.espera_max * 1000,
+            "en_cola": self._cola.qsize(),
+            "lotes": self.lotes,
+            "fragmentos": self.fragmentos,
+            "sin_voz": self.sin_voz,
+            "lote_medio": round(sum(tamanos) / len(tamanos), 2) if tamanos else None,
+            "latencia_p50_ms": round(latencias[len(latencias) // 2] * 1000, 1) if latencias else None,
+            "batch_disponible": self._batch_disponible
+        }
+
+    # ------------------------------------------------------------------ internos
+    def _iniciar(self):
+        with self._lock:
+            if self._iniciado:
+                return
+            for i in range(self.hilos):
+                threading.Thread(target=self._bucle, name=f"whisper-lote-{i}", daemon=True).start()
+            self._iniciado = True
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.perf_counter() + self.espera_max
+            while len(lote) < self.max_lote:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            try:
+                textos = en_hilo_nativo(self._decodificar_lote, [a for a, _, _ in lote])
+            except Exception as e:
+                for _, futuro, _ in lote:
+                    futuro.set_exception(e)
+                continue
+
+            ahora = time.perf_counter()
+            with self._lock:
+                self.lotes += 1
+                self.fragmentos += len(lote)
+                self._tamanos.append(len(lote))
+                self._latencias.extend(ahora - t for _, _, t in lote)
+            for (_, futuro, _), texto in zip(lote, textos):
+                futuro.set_result(texto)
+
+    def _transcribir_uno(self, audio) -> str:
+        segments, _ = obtener_modelo().transcribe(
+            audio,
+            language=self.idioma,
+            beam_size=self.beam_size,
+            vad_filter=True
+        )
+        return " ".join(segment.text for segment in segments)
+
+    def _tiene_voz(self, audio) -> bool:
+        return bool(get_speech_timestamps(audio, self.vad))
+
+    def _decodificar_lote(self, audios):
+        textos = [""] * len(audios)
+        por_lote = []
+        for i, audio in enumerate(audios):
+            if len(audio) / WHISPER_SAMPLE_RATE > MAX_CLIP_SEG:
+                textos[i] = self._transcribir_uno(audio)
+            elif self._tiene_voz(audio):
+                por_lote.append(i)
+            else:
+                self.sin_voz += 1  # Silencio: no vale una pasada de Whisper
+
+        if len(por_lote) == 1 or (por_lote and not self._batch_disponible):
+            for i in por_lote:
+                textos[i] = self._transcribir_uno(audios[i])
+            return textos
+        if not por_lote:
+            return textos
+
+        # Concatenar y marcar el inicio/fin de cada fragmento como un clip del lote
+        # (en muestras enteras, o en segundos si la versión los espera así)
+        en_segundos = _clips_en_segundos()
+        inicios, clips, offset = [], [], 0
+        for i in por_lote:
+            inicio, fin = offset, offset + len(audios[i])
+            inicios.append(inicio / WHISPER_SAMPLE_RATE)
+            if en_segundos:
+                clips.append({"start": inicio / WHISPER_SAMPLE_RATE, "end": fin / WHISPER_SAMPLE_RATE})
+            else:
+                clips.append({"start": inicio, "end": fin})
+            offset = fin
+        concatenado = np.concatenate([audios[i] for i in por_lote])
+
+        try:
+            if self._pipeline is None:
+                self._pipeline = BatchedInferencePipeline(model=obtener_modelo())
+            segments, _ = self._pipeline.transcribe(
+                concatenado,
+                language=self.idioma,
+                beam_size=self.beam_size,
+                batch_size=len(por_lote),
+                clip_timestamps=clips,
+                vad_filter=False
+            )
+            partes = [[] for _ in por_lote]
+            for segmento in segments:
+                indice = max(0, bisect_right(inicios, segmento.start + 0.01) - 1)
+                partes[indice].append(segmento.text)
+        except TypeError as e:
+            # Solo una versión de faster-whisper sin clip_timestamps en el pipeline por lotes
+            # desactiva los lotes; cualquier otro TypeError es un fallo real de este lote
+            if "unexpected keyword argument" not in str(e):
+                raise
+            print(f"⚠️ Inferencia por lotes no disponible ({e}); se decodifica uno a uno")
+            self._batch_disponible = False
+            for i in por_lote:
+                textos[i] = self._transcribir_uno(audios[i])
+            return textos
+
+        for i, parte in zip(por_lote, partes):
+            textos[i] = " ".join(parte)
+        return textos
+
+
+planificador = PlanificadorInferencia()
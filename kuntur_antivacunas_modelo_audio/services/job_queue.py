@@ -0,0 +1,134 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORKERS = int(os.getenv("JOBS_WORKERS", "4"))          # Alertas evaluándose en paralelo
+MAX_COLA = int(os.getenv("JOBS_QUEUE_MAX", "1000"))     # Trabajos en espera
+HISTORIAL = int(os.getenv("JOBS_HISTORY", "500"))       # Trabajos terminados que se conservan para consulta
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos en segundo plano, en el propio proceso (sin broker externo).
+
+    `encolar` devuelve enseguida un id; un pool acotado de hilos ejecuta los
+    trabajos. Cada trabajo guarda su estado (encolado, ejecutando, completado,
+    error, rechazado) y tiempos de espera y ejecución para poder consultarlos.
+    """
+
+    def __init__(self, workers=WORKERS, max_cola=MAX_COLA, historial=HISTORIAL):
+        self.workers = max(1, workers)
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._trabajos = OrderedDict()
+        self._historial = historial
+        self._lock = threading.Lock()
+        self._iniciado = False
+        self._latencias = deque(maxlen=200)
+        self.contadores = {"encolado": 0, "completado": 0, "error": 0, "rechazado": 0}
+
+    def _iniciar(self):
+        with self._lock:
+            if self._iniciado:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._bucle, name=f"trabajo-{i}", daemon=True).start()
+            self._iniciado = True
+
+    def encolar(self, tipo, funcion, *args, **kwargs):
+        """Encola `funcion(*args, **kwargs)`; devuelve el id del trabajo."""
+        self._iniciar()
+        trabajo = {
+            "id": str(uuid.uuid4()),
+            "tipo": tipo,
+            "estado": "encolado",
+            "encolado": time.time(),
+            "inicio": None,
+            "fin": None,
+            "espera_ms": None,
+            "duracion_ms": None,
+            "error": None
+        }
+        with self._lock:
+            self._trabajos[trabajo["id"]] = trabajo
+            self._recortar()
+        try:
+            self._cola.put_nowait((trabajo, funcion, args, kwargs))
+            with self._lock:
+                self.contadores["encolado"] += 1
+        except queue.Full:
+            with self._lock:
+                trabajo["estado"] = "rechazado"
+                trabajo["error"] = "Cola de trabajos llena"
+                self.contadores["rechazado"] += 1
+            print(f"⚠️ Cola de trabajos llena; trabajo {tipo} rechazado")
+        return trabajo["id"]
+
+    def _bucle(self):
+        # El estado de cada trabajo solo cambia con el lock tomado: /jobs lo lee a la vez
+        while True:
+            trabajo, funcion, args, kwargs = self._cola.get()
+            inicio = time.time()
+            with self._lock:
+                trabajo["estado"] = "ejecutando"
+                trabajo["inicio"] = inicio
+                trabajo["espera_ms"] = round((inicio - trabajo["encolado"]) * 1000, 1)
+            error = None
+            try:
+                funcion(*args, **kwargs)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"❌ Error en trabajo {trabajo['tipo']}: {e}")
+            fin = time.time()
+            with self._lock:
+                trabajo["estado"] = "error" if error else "completado"
+                trabajo["error"] = error
+                trabajo["fin"] = fin
+                trabajo["duracion_ms"] = round((fin - inicio) * 1000, 1)
+                self.contadores[trabajo["estado"]] += 1
+                self._latencias.append(fin - trabajo["encolado"])
+
+    def _recortar(self):
+        # Solo se olvidan trabajos terminados, de los más antiguos a los más nuevos
+        sobrantes = len(self._trabajos) - self._historial
+        if sobrantes <= 0:
+            return
+        for job_id in list(self._trabajos):
+            if sobrantes <= 0:
+                break
+            if self._trabajos[job_id]["estado"] in ("completado", "error", "rechazado"):
+                del self._trabajos[job_id]
+                sobrantes -= 1
+
+    def estado(self, job_id):
+        with self._lock:
+            trabajo = self._trabajos.get(job_id)
+            return dict(trabajo) if trabajo else None
+
+    def listar(self, limite=50):
+        with self._lock:
+            return [dict(t) for t in reversed(list(self._trabajos.values())[-limite:])]
+
+    def resumen(self):
+        # Foto tomada con el lock; los percentiles se calculan fuera
+        with self._lock:
+            latencias = list(self._latencias)
+            contadores = dict(self.contadores)
+            ejecutando = sum(1 for t in self._trabajos.values() if t["estado"] == "ejecutando")
+        latencias.sort()
+        return {
+            "workers": self.workers,
+            "en_cola": self._cola.qsize(),
+            "ejecutando": ejecutando,
+            **contadores,
+            "latencia_p50_ms": round(latencias[len(latencias) // 2] * 1000, 1) if latencias else None,
+            "latencia_p95_ms": round(latencias[int(len(latencias) * 0.95)] * 1000, 1) if latencias else None
+        }
+
+cola_trabajos = ColaTrabajos()
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from services.threat_prefilter import normalizar_texto
+
+load_dotenv()
+
+MAX_ENTRADAS = int(os.getenv("LLM_CACHE_MAX", "2048"))
+TTL_SEG = float(os.getenv("LLM_CACHE_TTL_SEC", "3600"))
+RUTA_DB = os.getenv("LLM_CACHE_DB", "")   # Archivo SQLite para conservar la caché entre reinicios (vacío = solo memoria)
+
+
+class CacheLLM:
+    """
+    Caché LRU con TTL de respuestas del LLM, indexada por el texto normalizado
+    (sin mayúsculas, tildes ni puntuación). Si hay `ruta_db`, cada entrada se
+    guarda también en SQLite y se recupera tras un reinicio.
+    """
+
+    def __init__(self, nombre, max_entradas=MAX_ENTRADAS, ttl_seg=TTL_SEG, ruta_db=RUTA_DB):
+        self.nombre = nombre
+        self.max_entradas = max(1, max_entradas)
+        self.ttl = ttl_seg
+        self._datos = OrderedDict()   # clave -> (guardado_en, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.aciertos_disco = 0
+        self.expirados = 0
+
+        self._db = None
+        if ruta_db:
+            try:
+                self._db = sqlite3.connect(ruta_db, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_llm ("
+                    "nombre TEXT, clave TEXT, valor TEXT, guardado REAL, PRIMARY KEY (nombre, clave))"
+                )
+                self._db.execute("DELETE FROM cache_llm WHERE guardado < ?", (time.time() - self.ttl,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Caché LLM sin disco ({ruta_db}): {e}")
+                self._db = None
+
+    def clave(self, texto):
+        return normalizar_texto(texto)
+
+    def obtener(self, texto):
+        """Devuelve el valor guardado para el texto, o None si no hay (o expiró)."""
+        clave = self.clave(texto)
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                if ahora - entrada[0] <= self.ttl:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return entrada[1]
+                del self._datos[clave]
+                self.expirados += 1
+
+            valor = self._leer_disco(clave, ahora)
+            if valor is not None:
+                self._guardar_memoria(clave, valor[0], valor[1])
+                self.aciertos += 1
+                self.aciertos_disco += 1
+                return valor[1]
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, texto, valor):
+        clave = self.clave(texto)
+        ahora = time.time()
+        with self._lock:
+            self._guardar_memoria(clave, ahora, valor)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache_llm (nombre, clave, valor, guardado) VALUES (?, ?, ?, ?)",
+                        (self.nombre, clave, json.dumps(valor, ensure_ascii=False), ahora)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ No se pudo guardar en la caché LLM en disco: {e}")
+
+    def _guardar_memoria(self, clave, guardado, valor):
+        self._datos[clave] = (guardado, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def _leer_disco(self, clave, ahora):
+        if self._db is None:
+            return None
+        try:
+            fila = self._db.execute(
+                "SELECT guardado, valor FROM cache_llm WHERE nombre = ? AND clave = ?",
+                (self.nombre, clave)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if fila is None or ahora - fila[0] > self.ttl:
+            return None
+        return fila[0], json.loads(fila[1])
+
+    def estado(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._datos),
+            "max_entradas": self.max_entradas,
+            "ttl_seg": self.ttl,
+            "aciertos": self.aciertos,
+            "aciertos_disco": self.aciertos_disco,
+            "fallos": self.fallos,
+            "expirados": self.expirados,
+            "tasa_acierto": round(self.aciertos / consultas, 3) if consultas else None,
+            "disco": self._db is not None
+        }
+
+
+cache_analisis = CacheLLM("analisis_amenaza")
+
+
+def estado_caches():
+    return {"analisis": cache_analisis.estado()}
@@ -0,0 +1,141 @@
+import os
+import uuid
+from datetime import datetime
+from services.notificador_upc import notificar_a_firebase
+from services.threat_detector import evaluar_amenaza
+from services.gemini_analyzer import aplicar_analisis
+from services.video_uploader import programar_evidencia, registrar_evidencia
+from services.db import coleccion_alertas
+from services.event_store import eventos_detectados
+from services.event_hub import hub
+from services.notificador_upc import notificar_a_upc
+from services.job_queue import cola_trabajos
+from services.context_window import ventanas, clave_sitio
+from services.video_buffer import grabadores, url_video_camara
+
+
+def procesar_transcripcion(texto, local):
+    """
+    Publica la transcripción en el panel, la añade a la ventana de contexto
+    del sitio y deja la evaluación de amenaza en la cola de trabajos, para que
+    el request no espere al LLM ni al video.
+    `local` trae sitio, nombre_local, ubicacion, ip_camara, latitud y longitud.
+    Devuelve el id del trabajo (consultable en /estado/jobs/<id>), o None si
+    el fragmento no traía texto.
+    """
+    # ======= NUEVO BLOQUE: Notificación de transcripción =======
+    notificacion_transcripcion = {
+        "mensaje": "📝 Transcripción en tiempo real",
+        "texto": texto,
+        "hora": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "tipo": "transcripcion",
+        "nombre_local": local["nombre_local"],
+        "ubicacion": local["ubicacion"],
+        "latitud": local["latitud"],
+        "longitud": local["longitud"],
+    }
+    sitio = clave_sitio(local)
+    hub.publicar(notificacion_transcripcion, sitio=sitio)
+    # ======= FIN BLOQUE NUEVO =======
+
+    # Mientras el local envía audio, su cámara se graba en memoria (pre-roll de la evidencia).
+    # Se identifica por la URL canónica de video, la misma que usan el monitor y /video_feed
+    grabadores.asegurar(url_video_camara(local.get("ip_camara")))
+
+    if not ventanas.agregar(sitio, texto):
+        return None
+    return cola_trabajos.encolar("alerta", evaluar_alerta, sitio, dict(local))
+
+
+def evaluar_alerta(sitio, local):
+    """
+    Se ejecuta en segundo plano: evalúa la ventana de contexto del sitio y, si
+    es una amenaza de un incidente nuevo, genera la alerta completa (análisis
+    IA, evidencia, Mongo, Firebase, UPC).
+    """
+    # Si varios fragmentos llegaron juntos, el primer trabajo evalúa la ventana con todos
+    texto = ventanas.pendiente(sitio)
+    if texto is None:
+        return
+
+    # Una sola llamada al LLM: detección, nivel de riesgo, resumen y recomendación.
+    # La caché se indexa por la ventana completa: el veredicto depende de todo el contexto
+    analisis = evaluar_amenaza(texto)
+    if analisis is not None and analisis.es_amenaza:
+        nueva, incidente_id = ventanas.registrar_alerta(sitio)
+        if not nueva:
+            print(f"🔁 Amenaza del incidente en curso {incidente_id} ({sitio}); no se repite la alerta")
+            return
+
+        evento_id = str(uuid.uuid4())
+        evento = {
+            "id": evento_id,
+            "incidente_id": incidente_id,
+            "texto": texto,
+            "hora": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "nombre_local": local["nombre_local"],
+            "ubicacion": local["ubicacion"],
+            "ip_camara": local["ip_camara"],
+            "latitud": local["latitud"],
+            "longitud": local["longitud"]
+        }
+
+        evento_enriquecido = aplicar_analisis(evento, analisis)
+
+        # Link al instante solo si la cámara tiene grabador conectado; si no, "No disponible"
+        evidencia = programar_evidencia(
+            evento_enriquecido,
+            bucket_name="kuntur-extorsiones",
+            key_id=os.getenv("B2_KEY_ID"),
+            app_key=os.getenv("B2_APP_KEY")
+        )
+
+        eventos_detectados.agregar(evento_enriquecido)
+
+        notificacion = {
+            "mensaje": "🚨 Alerta crítica detectada",
+            "evento_id": evento_id,
+            "texto": evento_enriquecido["texto"],
+            "link_evidencia": evento_enriquecido.get("link_evidencia", ""),
+            "ip_camera": evento_enriquecido.get("ip_camara"),
+            "analisis": evento_enriquecido.get("analisis_ia", "Sin análisis"),
+            "hora": evento_enriquecido["hora"],
+            "nombre_local": evento_enriquecido.get("nombre_local"),
+            "ubicacion": evento_enriquecido.get("ubicacion"),
+            "latitud": evento_enriquecido.get("latitud"),
+            "longitud": evento_enriquecido.get("longitud")
+        }
+
+        print("🔔 Notificación:", notificacion)
+        hub.publicar(notificacion, sitio=sitio)
+
+        # Notificar a Firebase
+        notificar_a_firebase(
+            trigger=True,
+            timestamp=int(datetime.now().timestamp() * 1000)
+        )
+        
+        # Guardar en MongoDB
+        coleccion_alertas.insert_one({
+            "evento_id": evento_id,
+            "nombre_local": evento_enriquecido.get("nombre_local"),
+            "ubicacion": evento_enriquecido.get("ubicacion"),
+            "ip_camara": evento_enriquecido.get("ip_camara"),
+            "latitud": evento_enriquecido.get("latitud"),
+            "longitud": evento_enriquecido.get("longitud"),
+            "texto_detectado": evento_enriquecido["texto"],
+            "descripcion_alerta": evento_enriquecido["analisis_ia"],
+            "nivel_riesgo": evento_enriquecido["nivel_riesgo"],
+            "fecha": datetime.now(),
+            "link_evidencia": evento_enriquecido.get("link_evidencia", "No disponible"),
+            "estado_evidencia": evento_enriquecido.get("estado_evidencia")
+        })
+        # El resultado final de la subida se anota cuando ya existe el documento
+        registrar_evidencia(evento_id, evidencia)
+
+        notificar_a_upc(
+            descripcion=evento_enriquecido["analisis_ia"],
+            ubicacion=evento_enriquecido["ubicacion"],
+            ip_camara=evento_enriquecido["ip_camara"],
+            url_evidencia=evento_enriquecido.get("link_evidencia")
+        )
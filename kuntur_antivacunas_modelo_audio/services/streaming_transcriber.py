@@ -0,0 +1,127 @@
+import re
+
+import numpy as np
+
+from services.audio_decoder import WHISPER_SAMPLE_RATE, pcm16_a_float32
+
+
+def _normalizar_palabra(palabra):
+    return re.sub(r"[^\w]", "", palabra.lower())
+
+
+class TranscriptorStreaming:
+    """
+    Transcripción incremental sobre una ventana deslizante de audio.
+
+    Cada `paso_seg` de audio nuevo se vuelve a decodificar la ventana completa
+    (desde la última palabra confirmada) con marcas de tiempo por palabra.
+    Una palabra pasa a *final* cuando dos hipótesis consecutivas coinciden en
+    ella (acuerdo local); el resto de la hipótesis se emite como *parcial*.
+    Al confirmar, la ventana se recorta en el final de la última palabra
+    confirmada, así que las palabras cortadas entre bloques no se pierden.
+    """
+
+    def __init__(self, modelo, paso_seg=1.0, ventana_max_seg=15.0, solape_seg=1.0,
+                 idioma="es", beam_size=5):
+        self.modelo = modelo
+        self.paso = int(paso_seg * WHISPER_SAMPLE_RATE)
+        self.ventana_max = int(ventana_max_seg * WHISPER_SAMPLE_RATE)
+        self.solape = solape_seg
+        self.idioma = idioma
+        self.beam_size = beam_size
+
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.inicio_ventana = 0.0      # segundos absolutos del primer sample de `audio`
+        self.pendiente = 0              # samples recibidos desde la última decodificación
+        self.resto = b""                # byte suelto de un mensaje impar (mitad de un sample)
+        self.confirmadas = []           # [(inicio, fin, palabra)]
+        self.hipotesis_previa = []
+        self.parcial = ""
+
+    @property
+    def fin_confirmado(self):
+        return self.confirmadas[-1][1] if self.confirmadas else self.inicio_ventana
+
+    def agregar_pcm(self, pcm: bytes):
+        """Agrega PCM s16le mono 16 kHz. Devuelve (texto_final_nuevo, parcial) o None si aún no toca decodificar."""
+        # Un mensaje puede cortar un sample por la mitad: el byte suelto pasa al siguiente
+        pcm = self.resto + bytes(pcm)
+        corte = len(pcm) - len(pcm) % 2
+        self.resto = pcm[corte:]
+        muestras = pcm16_a_float32(pcm[:corte])
+        self.audio = np.concatenate([self.audio, muestras])
+        self.pendiente += len(muestras)
+        if self.pendiente < self.paso:
+            return None
+        self.pendiente = 0
+        return self._procesar()
+
+    def finalizar(self):
+        """Confirma todo lo que quede en la ventana (fin del stream)."""
+        texto = ""
+        if len(self.audio):
+            texto, _ = self._procesar()
+        resto = self.hipotesis_previa
+        self.confirmadas.extend(resto)
+        self.hipotesis_previa = []
+        self.parcial = ""
+        self.audio = np.zeros(0, dtype=np.float32)
+        return (texto + "".join(p for _, _, p in resto)).strip()
+
+    def _decodificar(self):
+        # Las últimas palabras confirmadas dan contexto al modelo sin volver a emitirlas
+        contexto = "".join(p for _, _, p in self.confirmadas[-30:]).strip()
+        segments, _ = self.modelo.transcribe(
+            self.audio,
+            language=self.idioma,
+            beam_size=self.beam_size,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=contexto or None,
+            vad_filter=True
+        )
+        palabras = []
+        for segmento in segments:
+            for w in segmento.words or []:
+                inicio = self.inicio_ventana + w.start
+                fin = self.inicio_ventana + w.end
+                if fin > self.fin_confirmado + 0.05:
+                    palabras.append((inicio, fin, w.word))
+        return palabras
+
+    def _procesar(self):
+        hipotesis = self._decodificar()
+
+        # Acuerdo local: prefijo común entre la hipótesis actual y la anterior
+        n = 0
+        while (n < len(hipotesis) and n < len(self.hipotesis_previa)
+               and _normalizar_palabra(hipotesis[n][2]) == _normalizar_palabra(self.hipotesis_previa[n][2])):
+            n += 1
+        nuevas = hipotesis[:n]
+        resto = hipotesis[n:]
+
+        # Ventana demasiado larga sin acuerdo: se fuerza la confirmación de lo
+        # que ya está lejos del borde para acotar la latencia y el cómputo
+        if len(self.audio) > self.ventana_max and resto:
+            borde = self.inicio_ventana + len(self.audio) / WHISPER_SAMPLE_RATE - self.solape
+            forzadas = [p for p in resto if p[1] <= borde]
+            nuevas += forzadas
+            resto = resto[len(forzadas):]
+
+        self.confirmadas.extend(nuevas)
+        self.hipotesis_previa = resto
+        self.parcial = "".join(p for _, _, p in resto).strip()
+        self._recortar()
+        return "".join(p for _, _, p in nuevas).strip(), self.parcial
+
+    def _recortar(self):
+        """Descarta el audio ya confirmado; si no hay nada confirmado, limita la ventana."""
+        corte = self.fin_confirmado
+        if len(self.audio) > self.ventana_max:
+            corte = max(corte, self.inicio_ventana + (len(self.audio) - self.ventana_max) / WHISPER_SAMPLE_RATE)
+        muestras = int((corte - self.inicio_ventana) * WHISPER_SAMPLE_RATE)
+        if muestras > 0:
+            self.audio = self.audio[muestras:]
+            self.inicio_ventana += muestras / WHISPER_SAMPLE_RATE
+        # Solo se guardan las confirmadas recientes (contexto del prompt)
+        self.confirmadas = self.confirmadas[-30:]
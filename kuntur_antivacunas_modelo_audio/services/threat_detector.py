@@ -1,23 +1,30 @@
-from services.gemini_provider import get_llm
-from langchain.prompts import ChatPromptTemplate
+from typing import Optional
+from services.threat_prefilter import prefiltro
+from services.gemini_analyzer import AnalisisAmenaza, analizar_texto
 
-prompt_template = ChatPromptTemplate.from_messages([
-    ("human", """
-    Eres un sistema de seguridad que analiza textos transcritos de audio para detectar amenazas o extorsiones.
 
-    Evalúa el siguiente texto y responde solo con "SI" si representa una amenaza real (como extorsión, intimidación, coacción, etc), o "NO" si es inofensivo.
+def analisis_local(veredicto) -> AnalisisAmenaza:
+    """Veredicto del prefiltro cuando Gemini falla o no responde a tiempo: la alerta no se pierde."""
+    return AnalisisAmenaza(
+        es_amenaza=veredicto.decision == "sospechoso",
+        nivel_riesgo="ALTO" if veredicto.puntuacion >= 0.9 else "MEDIO",
+        resumen=f"[Análisis local, IA no disponible] Coincidencias: {', '.join(veredicto.motivos) or 'ninguna'}.",
+        recomendacion="Revisar la evidencia en video y confirmar con el local antes de actuar."
+    )
 
-    Texto:
-    "{texto}"
-    """)
-])
 
-def es_texto_amenaza(texto: str) -> bool:
-    try:
-        llm = get_llm()
-        prompt = prompt_template.format_messages(texto=texto)
-        response = llm.invoke(prompt)
-        return response.content.strip().lower() == "si"
-    except Exception as e:
-        print(f"❌ Error en verificación de amenaza: {e}")
-        return False
+def evaluar_amenaza(texto: str) -> Optional[AnalisisAmenaza]:
+    """
+    Detección y análisis en una sola llamada. Devuelve None si el prefiltro
+    descarta el texto; si el LLM falla o vence el plazo, usa el veredicto local.
+    """
+    veredicto = prefiltro.clasificar(texto)
+    # Lo claramente inofensivo (saludos, alucinaciones, charla sin léxico de amenaza) no llega a Gemini
+    if prefiltro.activo and veredicto.decision == "benigno":
+        return None
+    analisis = analizar_texto(texto)
+    if analisis is None:
+        print(f"⚠️ Sin respuesta de Gemini; veredicto local: {veredicto.decision} ({veredicto.puntuacion})")
+        return analisis_local(veredicto)
+    return analisis
+
@@ -0,0 +1,188 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ACTIVO = os.getenv("PREFILTER_ENABLED", "1") == "1"
+MODELO_PATH = os.getenv("PREFILTER_MODEL_PATH", "")                  # .onnx o .joblib (scikit-learn), opcional
+UMBRAL_BENIGNO = float(os.getenv("PREFILTER_BENIGN_THRESHOLD", "0.2"))     # Con modelo, por debajo: no se consulta al LLM
+UMBRAL_SOSPECHOSO = float(os.getenv("PREFILTER_SUSPICIOUS_THRESHOLD", "0.6"))
+MIN_PALABRAS = int(os.getenv("PREFILTER_MIN_WORDS", "3"))            # Textos más cortos sin léxico: benignos
+
+Veredicto = namedtuple("Veredicto", ["decision", "puntuacion", "motivos"])
+
+# Léxico de extorsión / intimidación (texto normalizado: minúsculas, sin tildes).
+# Peso = probabilidad aproximada de amenaza que aporta cada coincidencia.
+LEXICO = [
+    (0.7, r"\bvacunas?\b|\bvacunad[oa]s?\b"),
+    (0.7, r"\bextorsi\w*"),
+    (0.7, r"\bsecuestr\w*"),
+    (0.7, r"\bsi no (me |nos )?(pagas?|pagan|das|dan|colaboras?)\b"),
+    (0.7, r"\bte (vamos a|voy a) (matar|quemar|volar|reventar|desaparecer)\b"),
+    (0.7, r"\b(quemar|volar|balear|reventar) (el|tu|este|su) (local|negocio|tienda|carro|casa)\b"),
+    (0.6, r"\bsabemos donde (vives|viven|estudian?)\b"),
+    (0.6, r"\b(no|ni se te ocurra) (llames?|avises?|digas?) a (la )?policia\b"),
+    (0.6, r"\b(sicari\w*|granadas?|explosiv\w*|dinamita)\b"),
+    (0.5, r"\b(mat(ar|o|amos|en)|muert[oa]s?|plomo|balas?|bala(zo|cera))\b"),
+    (0.5, r"\bamenaz\w*"),
+    (0.4, r"\b(pistolas?|armas?|revolver|fierro)\b"),
+    (0.4, r"\b(tu|su) (familia|hijos?|hijas?|esposa|mujer)\b"),
+    (0.35, r"\b(cuota|colaboracion|proteccion|impuesto)\b"),
+    (0.3, r"\bpaga(r|s|n|lo|me|nos)?\b|\bpago\b"),
+    (0.3, r"\b(cuidadito|atente a las consecuencias|te va a pasar algo|te arrepentir\w*)\b"),
+    (0.2, r"\b(plata|dinero|billete|dolares)\b"),
+    (0.15, r"\b(banda|jefe|los de arriba|cada (semana|mes))\b"),
+]
+LEXICO = [(peso, re.compile(patron)) for peso, patron in LEXICO]
+
+# Frases que Whisper inventa sobre silencio o ruido
+ALUCINACIONES = [
+    "gracias por ver", "gracias por ver el video", "suscribete", "suscribanse",
+    "subtitulos realizados por", "subtitulos por la comunidad", "amara.org",
+    "dale like", "nos vemos en el proximo", "musica", "aplausos", "gracias",
+    "muchas gracias", "hasta la proxima", "chao", "adios"
+]
+FIRMAS_ALUCINACION = ("amara.org", "subtitulos realizados por", "subtitulado por")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"[^\w\s.]", " ", texto)
+    texto = re.sub(r"(?<!\w)\.|\.(?!\w)", " ", texto)  # Se conservan puntos internos (amara.org)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def senales_lexico(normalizado: str):
+    """Coincidencias del léxico en un texto ya normalizado: [(peso, coincidencia)]."""
+    senales = []
+    for peso, patron in LEXICO:
+        coincidencia = patron.search(normalizado)
+        if coincidencia:
+            senales.append((peso, coincidencia.group(0)))
+    return senales
+
+
+class _ModeloTexto:
+    """Clasificador de texto opcional: pipeline scikit-learn (joblib) o modelo ONNX exportado con skl2onnx."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._sesion = None
+        self._pipeline = None
+        if ruta.endswith(".onnx"):
+            import onnxruntime
+            self._sesion = onnxruntime.InferenceSession(ruta, providers=["CPUExecutionProvider"])
+            self._entrada = self._sesion.get_inputs()[0].name
+        else:
+            import joblib
+            self._pipeline = joblib.load(ruta)
+
+    def probabilidad(self, texto: str) -> float:
+        if self._pipeline is not None:
+            return float(self._pipeline.predict_proba([texto])[0][1])
+
+        import numpy as np
+        salidas = self._sesion.run(None, {self._entrada: np.array([[texto]])})
+        probabilidades = salidas[-1][0]
+        if isinstance(probabilidades, dict):  # ZipMap de skl2onnx: {clase: prob}
+            return float(probabilidades.get(1, probabilidades.get("1", 0.0)))
+        return float(probabilidades[1])
+
+
+class PrefiltroAmenazas:
+    """
+    Primera etapa local antes de Gemini: léxico de extorsión en español,
+    lista de alucinaciones de Whisper y, si hay, un modelo de texto pequeño.
+
+    - benigno: texto vacío, alucinación conocida, texto corto sin léxico o,
+      solo si hay modelo, puntuación < UMBRAL_BENIGNO. No se llama al LLM.
+    - ambiguo / sospechoso: se consulta al LLM.
+
+    Sin modelo, la falta de léxico no descarta nada: las amenazas implícitas
+    ("vengo de parte de…", "ya sabes lo que pasa") no tienen palabras clave.
+    """
+
+    def __init__(self, activo=ACTIVO, modelo_path=MODELO_PATH,
+                 umbral_benigno=UMBRAL_BENIGNO, umbral_sospechoso=UMBRAL_SOSPECHOSO):
+        self.activo = activo
+        self.umbral_benigno = umbral_benigno
+        self.umbral_sospechoso = umbral_sospechoso
+        self.modelo = None
+        if modelo_path:
+            try:
+                self.modelo = _ModeloTexto(modelo_path)
+                print(f"🧮 Prefiltro con modelo {modelo_path}")
+            except Exception as e:
+                print(f"⚠️ No se pudo cargar PREFILTER_MODEL_PATH ({e}); se usa solo el léxico")
+
+        self._lock = threading.Lock()
+        self.contadores = {"total": 0, "vacio": 0, "alucinacion": 0, "benigno": 0,
+                           "ambiguo": 0, "sospechoso": 0}
+
+    def _puntuar(self, normalizado):
+        """Devuelve (puntuación, motivos, si el modelo llegó a puntuar)."""
+        motivos = []
+        restante = 1.0
+        for peso, coincidencia in senales_lexico(normalizado):
+            motivos.append(coincidencia)
+            restante *= 1.0 - peso
+        puntuacion = 1.0 - restante
+
+        con_modelo = False
+        if self.modelo is not None:
+            try:
+                probabilidad = self.modelo.probabilidad(normalizado)
+                motivos.append(f"modelo={probabilidad:.2f}")
+                puntuacion = max(puntuacion, probabilidad)
+                con_modelo = True
+            except Exception as e:
+                print(f"⚠️ Error en modelo del prefiltro: {e}")
+        return puntuacion, motivos, con_modelo
+
+    def clasificar(self, texto: str) -> Veredicto:
+        normalizado = normalizar_texto(texto)
+        if not normalizado:
+            veredicto, motivo = Veredicto("benigno", 0.0, ["vacio"]), "vacio"
+        elif normalizado in ALUCINACIONES or any(f in normalizado for f in FIRMAS_ALUCINACION):
+            veredicto, motivo = Veredicto("benigno", 0.0, ["alucinacion"]), "alucinacion"
+        else:
+            puntuacion, motivos, con_modelo = self._puntuar(normalizado)
+            sin_lexico = all(m.startswith("modelo=") for m in motivos)
+            if sin_lexico and len(normalizado.split()) < MIN_PALABRAS:
+                motivos.append("texto corto")
+                puntuacion, decision = 0.0, "benigno"
+            elif puntuacion >= self.umbral_sospechoso:
+                decision = "sospechoso"
+            elif puntuacion >= self.umbral_benigno or not con_modelo:
+                decision = "ambiguo"   # Sin modelo, solo el LLM puede descartar el texto
+            else:
+                decision = "benigno"
+            veredicto, motivo = Veredicto(decision, round(puntuacion, 3), motivos), decision
+
+        with self._lock:
+            self.contadores["total"] += 1
+            self.contadores[motivo] += 1
+        return veredicto
+
+    def estado(self) -> dict:
+        total = self.contadores["total"]
+        evitadas = self.contadores["vacio"] + self.contadores["alucinacion"] + self.contadores["benigno"]
+        return {
+            "activo": self.activo,
+            "modelo": self.modelo.ruta if self.modelo else None,
+            "umbral_benigno": self.umbral_benigno,
+            "umbral_sospechoso": self.umbral_sospechoso,
+            **self.contadores,
+            "llamadas_llm_evitadas": evitadas,
+            "porcentaje_evitado": round(100.0 * evitadas / total, 1) if total else None
+        }
+
+
+prefiltro = PrefiltroAmenazas()
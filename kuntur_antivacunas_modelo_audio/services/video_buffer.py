@@ -0,0 +1,286 @@
+import io
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import imageio
+import numpy as np
+from dotenv import load_dotenv
+
+from services.async_mode import en_hilo_nativo
+
+load_dotenv()
+
+FPS = float(os.getenv("PREROLL_FPS", "10"))                   # Frames por segundo que se guardan
+PREROLL_SEG = float(os.getenv("PREROLL_SEC", "10"))           # Video anterior a la alerta
+POSTROLL_SEG = float(os.getenv("POSTROLL_SEC", "5"))          # Video posterior a la alerta
+CALIDAD_JPEG = int(os.getenv("PREROLL_JPEG_QUALITY", "75"))
+INACTIVO_SEG = float(os.getenv("PREROLL_IDLE_SEC", "300"))    # Sin actividad del local, la grabación se detiene
+FPS_VIVO = float(os.getenv("MJPEG_FPS", "15"))                # Frames por segundo mientras alguien ve /video_feed
+CALIDAD_VIVO = int(os.getenv("MJPEG_JPEG_QUALITY", str(CALIDAD_JPEG)))
+SUFIJOS_CAMARA = ("/audio.wav", "/audio.opus", "/audio.aac", "/video")
+
+
+def url_video_camara(ip_camara):
+    """
+    URL canónica del video de la cámara, con la que se identifica en todo el
+    servicio (grabadores, monitor, evidencias, /video_feed). El registro del
+    usuario guarda `<cámara>/video` y captura_audio puede enviar la URL del
+    audio (`<cámara>/audio.wav`) o la de la cámara sin ruta: todas quedan en
+    `<cámara>/video`. Las URLs que no son HTTP (RTSP, etc.) se usan tal cual.
+    """
+    if not ip_camara:
+        return None
+    base = ip_camara.strip().rstrip("/")
+    if not base.lower().startswith(("http://", "https://")):
+        return base
+    for sufijo in SUFIJOS_CAMARA:
+        if base.endswith(sufijo):
+            base = base[:-len(sufijo)]
+            break
+    return f"{base}/video"
+
+
+class GrabadorCamara:
+    """
+    Única conexión a una cámara IP, compartida por el pre-roll de evidencias
+    y por todos los que ven /video_feed. Cada frame se decodifica y se
+    comprime a JPEG una sola vez:
+
+    - los últimos `preroll_seg + postroll_seg` segundos quedan en un anillo
+      acotado en memoria (`instantanea` los devuelve ante una alerta);
+    - el último JPEG se reparte tal cual a todos los espectadores.
+
+    Sigue activo mientras haya espectadores o actividad reciente del local.
+    """
+
+    def __init__(self, url, fps=FPS, preroll_seg=PREROLL_SEG, postroll_seg=POSTROLL_SEG,
+                 calidad=CALIDAD_JPEG, al_terminar=None):
+        self.url = url
+        self.fps = max(1.0, fps)
+        self.calidad = calidad
+        self.retencion = preroll_seg + postroll_seg
+        self.frames = deque(maxlen=int(max(self.fps, FPS_VIVO) * self.retencion) + 1)  # (time.time(), jpeg)
+        self.conectada = False
+        self.terminado = False
+        self.reconexiones = 0
+        self.espectadores = 0
+        self.ultimo_uso = 0.0   # Última actividad del local (0 = solo espectadores)
+        self._ultimo = (0, None)   # (secuencia, jpeg) para los espectadores
+        self._al_terminar = al_terminar
+        self._lock = threading.Lock()
+        self._nuevo_frame = threading.Condition(self._lock)
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name=f"camara-{url}", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def tocar(self):
+        self.ultimo_uso = time.monotonic()
+
+    def _inactivo(self):
+        return self.espectadores == 0 and time.monotonic() - self.ultimo_uso > INACTIVO_SEG
+
+    def _bucle(self):
+        espera = 1.0
+        try:
+            while not self._detener.is_set() and not self._inactivo():
+                cap = en_hilo_nativo(cv2.VideoCapture, self.url)
+                if not cap.isOpened():
+                    cap.release()
+                    self.reconexiones += 1
+                    self._detener.wait(espera)
+                    espera = min(espera * 2, 30.0)
+                    continue
+
+                espera = 1.0
+                self.conectada = True
+                proximo = 0.0
+                try:
+                    while not self._detener.is_set():
+                        ahora = time.monotonic()
+                        en_vivo = self.espectadores > 0
+                        # Solo se comprimen `fps` frames por segundo; el resto se lee y se descarta
+                        leido, jpeg = en_hilo_nativo(
+                            self._leer, cap, ahora >= proximo, CALIDAD_VIVO if en_vivo else self.calidad
+                        )
+                        if not leido:
+                            break
+                        if jpeg is not None:
+                            proximo = ahora + 1.0 / (max(self.fps, FPS_VIVO) if en_vivo else self.fps)
+                            self._publicar(jpeg)
+                        if self._inactivo():
+                            break
+                finally:
+                    cap.release()
+                    self.conectada = False
+                self.reconexiones += 1
+        finally:
+            with self._nuevo_frame:
+                self.terminado = True
+                self._nuevo_frame.notify_all()
+            if self._al_terminar:
+                self._al_terminar(self)
+
+    @staticmethod
+    def _leer(cap, comprimir, calidad):
+        if not cap.grab():
+            return False, None
+        if not comprimir:
+            return True, None
+        ok, frame = cap.retrieve()
+        if not ok:
+            return True, None
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+        return True, jpeg.tobytes() if ok else None
+
+    def _publicar(self, jpeg):
+        ahora = time.time()
+        with self._nuevo_frame:
+            self.frames.append((ahora, jpeg))
+            while self.frames and ahora - self.frames[0][0] > self.retencion:
+                self.frames.popleft()
+            self._ultimo = (self._ultimo[0] + 1, jpeg)
+            self._nuevo_frame.notify_all()
+
+    def esperar_frame(self, ultima_secuencia, timeout=5.0):
+        """Siguiente JPEG posterior a `ultima_secuencia`: (secuencia, jpeg), o None si no llegó o el grabador terminó."""
+        with self._nuevo_frame:
+            if self._ultimo[0] <= ultima_secuencia and not self.terminado:
+                self._nuevo_frame.wait(timeout)
+            if self._ultimo[0] <= ultima_secuencia:
+                return None
+            return self._ultimo
+
+    def instantanea(self, momento, preroll_seg=PREROLL_SEG, postroll_seg=POSTROLL_SEG):
+        """
+        Frames entre `momento - preroll_seg` y `momento + postroll_seg`
+        (`momento` en time.time()). Espera a que pase el post-roll.
+        """
+        fin = momento + postroll_seg
+        while time.time() < fin and self.conectada:
+            time.sleep(min(0.2, fin - time.time()))
+        with self._lock:
+            return [(t, jpeg) for t, jpeg in self.frames if momento - preroll_seg <= t <= fin]
+
+    def estado(self):
+        with self._lock:
+            segundos = self.frames[-1][0] - self.frames[0][0] if len(self.frames) > 1 else 0.0
+            memoria = sum(len(j) for _, j in self.frames)
+        return {
+            "camara": self.url,
+            "conectada": self.conectada,
+            "espectadores": self.espectadores,
+            "frames": len(self.frames),
+            "segundos": round(segundos, 1),
+            "memoria_kb": round(memoria / 1024, 1),
+            "reconexiones": self.reconexiones
+        }
+
+
+def codificar_mp4(frames, fps_max=max(FPS, FPS_VIVO)):
+    """Codifica una lista de (tiempo, jpeg) a MP4 en memoria; devuelve el BytesIO (sin copiarlo)."""
+    return en_hilo_nativo(_codificar_mp4, frames, fps_max)
+
+
+def _codificar_mp4(frames, fps_max):
+    duracion = frames[-1][0] - frames[0][0] if len(frames) > 1 else 0.0
+    fps = min(fps_max, max(1.0, (len(frames) - 1) / duracion)) if duracion > 0 else fps_max
+    video_buffer = io.BytesIO()
+    writer = imageio.get_writer(video_buffer, format='mp4', fps=fps, macro_block_size=None)
+    try:
+        for _, jpeg in frames:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            writer.append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        writer.close()
+    video_buffer.seek(0)
+    return video_buffer
+
+
+class RegistroGrabadores:
+    """
+    Un grabador por cámara. Se crea con la actividad del local o con el
+    primer espectador, y se detiene solo cuando se va el último espectador
+    y el local lleva `PREROLL_IDLE_SEC` sin actividad.
+    """
+
+    def __init__(self):
+        self._grabadores = {}
+        self._lock = threading.Lock()
+
+    def _obtener_o_crear(self, url):
+        url = url_video_camara(url)
+        grabador = self._grabadores.get(url)
+        if grabador is None or grabador.terminado:
+            grabador = GrabadorCamara(url, al_terminar=self._quitar)
+            self._grabadores[url] = grabador
+            grabador.iniciar()
+            print(f"🎥 Cámara compartida activa: {url}")
+        return grabador
+
+    def asegurar(self, url):
+        """Actividad del local: mantiene la cámara grabando para el pre-roll."""
+        if not url_video_camara(url):
+            return None
+        with self._lock:
+            grabador = self._obtener_o_crear(url)
+            grabador.tocar()
+            return grabador
+
+    def agregar_espectador(self, url):
+        with self._lock:
+            grabador = self._obtener_o_crear(url)
+            grabador.espectadores += 1
+            return grabador
+
+    def quitar_espectador(self, grabador):
+        with self._lock:
+            grabador.espectadores = max(0, grabador.espectadores - 1)
+
+    def obtener(self, url):
+        return self._grabadores.get(url_video_camara(url))
+
+    def _quitar(self, grabador):
+        with self._lock:
+            if self._grabadores.get(grabador.url) is grabador:
+                del self._grabadores[grabador.url]
+        print(f"🎥 Cámara compartida detenida: {grabador.url}")
+
+    def estado(self):
+        return [g.estado() for g in list(self._grabadores.values())]
+
+
+grabadores = RegistroGrabadores()
+
+
+def generar_mjpeg(url):
+    """Frames MJPEG (multipart) de la cámara compartida; el mismo JPEG para todos los espectadores."""
+    grabador = grabadores.agregar_espectador(url)
+    secuencia = 0
+    esperas = 0
+    try:
+        while True:
+            frame = grabador.esperar_frame(secuencia)
+            if frame is None:
+                if grabador.terminado:
+                    # Se detuvo justo cuando llegaba este espectador: se engancha a uno nuevo
+                    grabadores.quitar_espectador(grabador)
+                    grabador = grabadores.agregar_espectador(url)
+                    secuencia = 0
+                esperas += 1
+                if esperas >= 6:
+                    break  # 30 s sin imagen: se corta para no retener la cámara si el cliente ya se fue
+                continue
+            esperas = 0
+            secuencia, jpeg = frame
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+    finally:
+        grabadores.quitar_espectador(grabador)
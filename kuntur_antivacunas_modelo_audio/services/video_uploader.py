@@ -1,10 +1,24 @@
 import time
 import io
+from concurrent.futures import Future
 import cv2
 import imageio
-import b2sdk.v2
+from services.video_buffer import grabadores, codificar_mp4, url_video_camara
+from services.evidence_storage import subidor
+from services.job_queue import cola_trabajos
+from services.event_store import eventos_detectados
+from services.async_mode import en_hilo_nativo
 
-def grabar_y_subir_video(camera_ip_url, bucket_name, key_id, app_key):
+SIN_EVIDENCIA = "No disponible"
+
+
+def grabar_video(camera_ip_url):
+    """Graba 5 s abriendo una conexión nueva a la cámara (cuando no hay pre-roll en memoria)."""
+    # OpenCV e imageio no ceden el control a gevent: la grabación va a un hilo real
+    return en_hilo_nativo(_grabar_video, camera_ip_url)
+
+
+def _grabar_video(camera_ip_url):
     cap = cv2.VideoCapture(camera_ip_url)
     if not cap.isOpened():
         raise RuntimeError("No se pudo conectar a la cámara IP.")
@@ -18,9 +32,12 @@ def grabar_y_subir_video(camera_ip_url, bucket_name, key_id, app_key):
 
     try:
         frames_grabados = 0
+        limite = time.monotonic() + segundos * 3
         while frames_grabados < total_frames:
             ret, frame = cap.read()
             if not ret:
+                if time.monotonic() > limite:
+                    raise RuntimeError("La cámara IP no entrega frames.")
                 print("⚠️ No se pudo leer frame, reintentando...")
                 time.sleep(0.05)  # pequeña espera si falla
                 continue
@@ -30,13 +47,90 @@ def grabar_y_subir_video(camera_ip_url, bucket_name, key_id, app_key):
         cap.release()
         writer.close()
 
-    # Subir a Backblaze
-    info = b2sdk.v2.InMemoryAccountInfo()
-    b2_api = b2sdk.v2.B2Api(info)
-    b2_api.authorize_account("production", key_id, app_key)
-    bucket = b2_api.get_bucket_by_name(bucket_name)
+    video_buffer.seek(0)
+    return video_buffer
+
+
+def video_de_evidencia(camera_ip_url, momento):
+    """Pre-roll + post-roll del grabador de la cámara; si no hay, grabación directa."""
+    grabador = grabadores.obtener(camera_ip_url)
+    if grabador is not None:
+        frames = grabador.instantanea(momento)
+        if frames:
+            return codificar_mp4(frames)
+    return grabar_video(camera_ip_url)
+
+
+def programar_evidencia(evento, bucket_name, key_id, app_key):
+    """
+    Prepara la evidencia en video de `evento` y anota en él `link_evidencia`
+    y `estado_evidencia`:
+
+    - si el grabador de la cámara está conectado, el link se da al instante
+      ("pendiente"): la captura del post-roll y la codificación van a la cola
+      de trabajos y la subida al pool del subidor. Devuelve un Future con el
+      resultado, que `registrar_evidencia` anota en el evento al terminar;
+    - si no, se graba y se sube aquí mismo, como antes ("subida");
+    - sin cámara, o si la grabación o la subida fallan, "No disponible".
+    """
+    camara = url_video_camara(evento.get("ip_camara"))
+    evento["link_evidencia"] = SIN_EVIDENCIA
+    evento["estado_evidencia"] = "error"
+    if not camara:
+        evento["estado_evidencia"] = "sin camara"
+        return None
+
+    momento = time.time()
+    file_name = f"evidencia_{int(momento * 1000)}.mp4"
+    grabador = grabadores.obtener(camara)
+    try:
+        if grabador is None or not grabador.conectada:
+            evento["link_evidencia"] = subidor.subir(grabar_video(camara), file_name, bucket_name, key_id, app_key)
+            evento["estado_evidencia"] = "subida"
+            return None
+        link = subidor.url(bucket_name, key_id, app_key, file_name)
+    except Exception as e:
+        print(f"⚠️ Error subiendo video: {e}")
+        return None
+
+    resultado = Future()
+
+    def _copiar(subida):
+        if subida.exception() is not None:
+            resultado.set_exception(subida.exception())
+        else:
+            resultado.set_result(subida.result())
+
+    def _grabar():
+        try:
+            video = video_de_evidencia(camara, momento)
+        except Exception as e:
+            resultado.set_exception(e)
+            raise
+        subidor.subir_en_segundo_plano(video, file_name, bucket_name, key_id, app_key).add_done_callback(_copiar)
+
+    job_id = cola_trabajos.encolar("evidencia", _grabar)
+    if (cola_trabajos.estado(job_id) or {}).get("estado") == "rechazado":
+        return None
+    evento["link_evidencia"] = link
+    evento["estado_evidencia"] = "pendiente"
+    return resultado
+
+
+def registrar_evidencia(evento_id, resultado):
+    """
+    Cuando termina la evidencia en segundo plano, anota si se subió o falló en
+    el evento y en su alerta de Mongo. Se llama después de guardar la alerta,
+    así la actualización nunca llega antes que el documento.
+    """
+    if resultado is None:
+        return
 
-    file_name = f"evidencia_{int(time.time())}.mp4"
-    bucket.upload_bytes(video_buffer.getvalue(), file_name)
+    def _anotar(futuro):
+        if futuro.exception() is None:
+            eventos_detectados.actualizar(evento_id, estado_evidencia="subida")
+        else:
+            print(f"⚠️ La evidencia de {evento_id} no se pudo subir: {futuro.exception()}")
+            eventos_detectados.actualizar(evento_id, estado_evidencia="error", link_evidencia=SIN_EVIDENCIA)
 
-    return f"https://f005.backblazeb2.com/file/{bucket_name}/{file_name}"
+    resultado.add_done_callback(_anotar)
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from faster_whisper import WhisperModel
+
+from services.audio_decoder import WHISPER_SAMPLE_RATE
+
+load_dotenv()
+
+MODELO_DEFECTO = os.getenv("WHISPER_MODEL_SIZE", "base")
+MODELO_STREAMING = os.getenv("WHISPER_STREAM_MODEL_SIZE", MODELO_DEFECTO)
+DISPOSITIVO = os.getenv("WHISPER_DEVICE", "cpu")
+COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))   # 0 = lo decide CTranslate2
+NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))   # Decodificaciones en paralelo por modelo
+CALENTAR = os.getenv("WHISPER_WARMUP", "1") == "1"
+
+# Registro único de modelos: (tamaño, compute_type) -> WhisperModel
+_modelos = {}
+_estado = {}
+_locks = {}
+_lock = threading.Lock()
+
+
+def _calentar(modelo):
+    """Decodifica 1 s de silencio para inicializar kernels y memoria antes del primer request."""
+    segments, _ = modelo.transcribe(
+        np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32),
+        language="es",
+        beam_size=1,
+        vad_filter=False
+    )
+    list(segments)
+
+
+def obtener_modelo(tamano=None, compute_type=None) -> WhisperModel:
+    """
+    Devuelve el modelo Whisper del tamaño indicado, cargándolo una sola vez
+    para todo el proceso (lo comparten todos los blueprints).
+    """
+    clave = (tamano or MODELO_DEFECTO, compute_type or COMPUTE_TYPE)
+    modelo = _modelos.get(clave)
+    if modelo is not None:
+        return modelo
+
+    with _lock:
+        lock_clave = _locks.setdefault(clave, threading.Lock())
+    with lock_clave:
+        if clave in _modelos:
+            return _modelos[clave]
+
+        inicio = time.perf_counter()
+        print(f"🧠 Cargando Whisper '{clave[0]}' ({DISPOSITIVO}, {clave[1]})…")
+        modelo = WhisperModel(
+            clave[0],
+            device=DISPOSITIVO,
+            compute_type=clave[1],
+            cpu_threads=CPU_THREADS,
+            num_workers=NUM_WORKERS
+        )
+        carga = time.perf_counter() - inicio
+
+        calentamiento = None
+        if CALENTAR:
+            inicio = time.perf_counter()
+            _calentar(modelo)
+            calentamiento = time.perf_counter() - inicio
+
+        _estado[clave] = {
+            "modelo": clave[0],
+            "compute_type": clave[1],
+            "dispositivo": DISPOSITIVO,
+            "carga_seg": round(carga, 2),
+            "calentamiento_seg": round(calentamiento, 2) if calentamiento is not None else None
+        }
+        _modelos[clave] = modelo
+        print(f"✅ Whisper '{clave[0]}' listo en {carga:.1f}s")
+        return modelo
+
+
+def precargar_modelos():
+    """Carga (y calienta) al arrancar los modelos configurados, para que el primer request no espere."""
+    for tamano in {MODELO_DEFECTO, MODELO_STREAMING}:
+        obtener_modelo(tamano)
+
+
+def estado_modelos():
+    return list(_estado.values())
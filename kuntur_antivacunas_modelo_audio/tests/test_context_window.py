@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("cv2")
+
+from services.context_window import VentanasContexto, clave_sitio
+from services.llm_cache import CacheLLM
+from services.video_buffer import url_video_camara
+
+
+def test_clave_sitio_prefiere_el_sitio_de_captura():
+    local = {"sitio": "tienda-rosa", "ip_camara": "http://10.0.0.5:8080/audio.wav", "nombre_local": "Tienda Rosa"}
+    assert clave_sitio(local) == "tienda-rosa"
+
+
+def test_url_video_camara_es_la_misma_para_el_registro_y_el_audio():
+    for url in ("http://10.0.0.5:8080/video", "http://10.0.0.5:8080/audio.wav", "http://10.0.0.5:8080/"):
+        assert url_video_camara(url) == "http://10.0.0.5:8080/video"
+    assert url_video_camara("rtsp://10.0.0.5/live") == "rtsp://10.0.0.5/live"
+    assert url_video_camara("") is None
+
+
+def test_clave_sitio_usa_la_url_canonica_de_la_camara():
+    local = {"ip_camara": "http://10.0.0.5:8080/audio.wav", "nombre_local": "Tienda Rosa"}
+    assert clave_sitio(local) == "http://10.0.0.5:8080/video"
+    assert clave_sitio({"nombre_local": "Tienda Rosa"}) == "Tienda Rosa"
+
+
+def test_pendiente_devuelve_la_ventana_completa():
+    ventanas = VentanasContexto()
+    ventanas.agregar("s", "vengo de parte del jefe")
+    assert ventanas.pendiente("s") == "vengo de parte del jefe"
+    ventanas.agregar("s", "tienes hasta el viernes")
+    ventanas.agregar("s", "ya sabes lo que pasa")
+    assert ventanas.pendiente("s") == "vengo de parte del jefe tienes hasta el viernes ya sabes lo que pasa"
+    assert ventanas.pendiente("s") is None
+
+
+def test_ventanas_con_distinto_contexto_no_comparten_clave_de_cache():
+    ventanas = VentanasContexto()
+    ventanas.agregar("a", "vengo de parte del jefe tienes hasta el viernes")
+    ventanas.agregar("a", "ya sabes lo que pasa")
+    ventanas.agregar("b", "buenos días señora el partido estuvo bueno")
+    ventanas.agregar("b", "ya sabes lo que pasa")
+    cache = CacheLLM("prueba", ruta_db="")
+    assert cache.clave(ventanas.pendiente("a")) != cache.clave(ventanas.pendiente("b"))
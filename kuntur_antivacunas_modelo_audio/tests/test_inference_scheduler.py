@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faster_whisper")
+
+from services import inference_scheduler
+from services.audio_decoder import WHISPER_SAMPLE_RATE
+
+
+class PipelineFalso:
+    """
+    Imita BatchedInferencePipeline: con faster-whisper < 1.2 recorta cada clip
+    con audio[start:end]; desde 1.2 convierte antes los segundos a muestras.
+    """
+
+    llamadas = []
+    en_segundos = True
+
+    def __init__(self, model=None):
+        pass
+
+    def transcribe(self, audio, clip_timestamps=None, **kwargs):
+        PipelineFalso.llamadas.append({"clips": clip_timestamps, **kwargs})
+        if PipelineFalso.en_segundos:
+            clip_timestamps = [{k: int(v * WHISPER_SAMPLE_RATE) for k, v in c.items()} for c in clip_timestamps]
+        segmentos = []
+        for n, clip in enumerate(clip_timestamps):
+            recorte = audio[clip["start"]:clip["end"]]
+            assert len(recorte) == clip["end"] - clip["start"] > 0
+            segmentos.append(SimpleNamespace(start=clip["start"] / WHISPER_SAMPLE_RATE, text=f"fragmento {n}"))
+        return iter(segmentos), None
+
+
+@pytest.fixture
+def planificador(monkeypatch):
+    PipelineFalso.llamadas = []
+    monkeypatch.setattr(inference_scheduler, "BatchedInferencePipeline", PipelineFalso)
+    monkeypatch.setattr(inference_scheduler, "obtener_modelo", lambda: object())
+    p = inference_scheduler.PlanificadorInferencia(max_lote=4)
+    monkeypatch.setattr(p, "_tiene_voz", lambda audio: True)
+
+    def no_por_lotes(audio):
+        raise AssertionError("el fragmento no debía decodificarse uno a uno")
+
+    monkeypatch.setattr(p, "_transcribir_uno", no_por_lotes)
+    return p
+
+
+@pytest.mark.parametrize("version, esperados", [
+    ("1.1.1", [{"start": 0, "end": WHISPER_SAMPLE_RATE},
+               {"start": WHISPER_SAMPLE_RATE, "end": 3 * WHISPER_SAMPLE_RATE}]),
+    ("1.2.1", [{"start": 0.0, "end": 1.0}, {"start": 1.0, "end": 3.0}]),
+])
+def test_lote_de_dos_fragmentos_va_por_la_ruta_por_lotes(planificador, monkeypatch, version, esperados):
+    monkeypatch.setattr(inference_scheduler, "FW_VERSION", version)
+    monkeypatch.setattr(PipelineFalso, "en_segundos", version >= "1.2")
+    audios = [np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32),
+              np.zeros(2 * WHISPER_SAMPLE_RATE, dtype=np.float32)]
+
+    textos = planificador._decodificar_lote(audios)
+
+    assert textos == ["fragmento 0", "fragmento 1"]
+    assert len(PipelineFalso.llamadas) == 1
+    llamada = PipelineFalso.llamadas[0]
+    assert llamada["batch_size"] == 2
+    assert llamada["clips"] == esperados
+    if version < "1.2":
+        assert all(isinstance(v, int) for clip in llamada["clips"] for v in clip.values())
+    assert planificador.estado()["batch_disponible"] is True
+
+
+def test_type_error_al_decodificar_no_desactiva_los_lotes(planificador, monkeypatch):
+    def falla(self, audio, **kwargs):
+        raise TypeError("slice indices must be integers")
+
+    monkeypatch.setattr(PipelineFalso, "transcribe", falla)
+    audios = [np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)] * 2
+
+    with pytest.raises(TypeError):
+        planificador._decodificar_lote(audios)
+    assert planificador.estado()["batch_disponible"] is True
+
+
+def test_version_sin_clip_timestamps_decodifica_uno_a_uno(planificador, monkeypatch):
+    def sin_clips(self, audio, **kwargs):
+        raise TypeError("transcribe() got an unexpected keyword argument 'clip_timestamps'")
+
+    monkeypatch.setattr(PipelineFalso, "transcribe", sin_clips)
+    monkeypatch.setattr(planificador, "_transcribir_uno", lambda audio: "uno a uno")
+    audios = [np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)] * 2
+
+    assert planificador._decodificar_lote(audios) == ["uno a uno", "uno a uno"]
+    assert planificador.estado()["batch_disponible"] is False
@@ -0,0 +1,17 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faster_whisper")
+
+from services.streaming_transcriber import TranscriptorStreaming
+
+
+def test_agregar_pcm_guarda_el_byte_suelto_para_el_siguiente_mensaje():
+    # Paso largo: solo se acumula audio, no se llega a decodificar
+    transcriptor = TranscriptorStreaming(modelo=None, paso_seg=10)
+    pcm = np.array([1000, -2000, 3000], dtype="<i2").tobytes()
+
+    assert transcriptor.agregar_pcm(pcm[:3]) is None
+    assert transcriptor.agregar_pcm(pcm[3:]) is None
+    np.testing.assert_allclose(transcriptor.audio * 32768.0, [1000, -2000, 3000])
+    assert transcriptor.resto == b""
@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from services.threat_prefilter import PrefiltroAmenazas
+
+
+class ModeloFalso:
+    ruta = "modelo-falso.onnx"
+
+    def __init__(self, probabilidad):
+        self._probabilidad = probabilidad
+
+    def probabilidad(self, texto):
+        return self._probabilidad
+
+
+@pytest.fixture
+def prefiltro():
+    return PrefiltroAmenazas(activo=True, modelo_path="")
+
+
+@pytest.mark.parametrize("texto", [
+    "Vengo de parte de los Choneros, tienes hasta el viernes o ya sabes lo que pasa",
+    "El jefe manda a decir que no se olvide del sobre de este mes",
+    "Mejor cierre temprano hoy, no vaya a ser que le pase algo a su negocio",
+    "Ya conocemos a qué hora sale su hija del colegio",
+])
+def test_amenazas_implicitas_van_al_llm_sin_modelo(prefiltro, texto):
+    assert prefiltro.clasificar(texto).decision != "benigno"
+
+
+@pytest.mark.parametrize("texto", [
+    "",
+    "   ",
+    "Gracias por ver el video",
+    "Subtítulos realizados por la comunidad de Amara.org",
+    "Buenos días",
+])
+def test_vacio_alucinaciones_y_textos_cortos_se_descartan(prefiltro, texto):
+    assert prefiltro.clasificar(texto).decision == "benigno"
+
+
+def test_lexico_de_extorsion_es_sospechoso(prefiltro):
+    veredicto = prefiltro.clasificar("Si no pagas la vacuna te vamos a quemar el local")
+    assert veredicto.decision == "sospechoso"
+
+
+def test_con_modelo_la_puntuacion_baja_descarta(prefiltro):
+    prefiltro.modelo = ModeloFalso(0.05)
+    assert prefiltro.clasificar("Me da dos panes y una leche por favor").decision == "benigno"
+
+
+def test_con_modelo_una_amenaza_implicita_no_se_descarta(prefiltro):
+    prefiltro.modelo = ModeloFalso(0.7)
+    veredicto = prefiltro.clasificar("Vengo de parte de los Choneros, tienes hasta el viernes")
+    assert veredicto.decision == "sospechoso"
+
+
+def test_si_el_modelo_falla_se_consulta_al_llm(prefiltro):
+    class ModeloRoto(ModeloFalso):
+        def probabilidad(self, texto):
+            raise RuntimeError("onnx")
+
+    prefiltro.modelo = ModeloRoto(0.0)
+    assert prefiltro.clasificar("Me da dos panes y una leche por favor").decision == "ambiguo"